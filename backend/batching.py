@@ -0,0 +1,211 @@
+"""
+Dynamic micro-batching in front of the food predictors.
+
+Concurrent /predict requests are collected for up to ``max_wait_ms`` (or until
+``max_batch_size`` images are waiting) and classified with a single call to
+``predictor.predict_batch()``. Every caller awaits its own result.
+
+Batches run on a dedicated, bounded worker pool so the asyncio event loop keeps
+serving health checks and chat while the model is busy. When more than
+``max_queue`` images are already waiting, ``submit()`` fails fast with
+``QueueFullError`` instead of letting latency grow without bound.
+
+Failures stay with the image that caused them: predict_batch() puts an
+exception in the slot of an image it could not decode, and if the batched call
+itself fails, the batch is re-run one image at a time so only the bad upload's
+caller gets the error.
+"""
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """Raised when the inference queue is at capacity."""
+
+    def __init__(self, depth: int):
+        super().__init__(f"Inference queue is full ({depth} waiting)")
+        self.depth = depth
+
+
+def _fail_stopped(entries: List[tuple]):
+    for _, future, _ in entries:
+        if not future.done():
+            future.set_exception(RuntimeError("Batch scheduler stopped"))
+
+
+class BatchScheduler:
+    def __init__(self, predictor, max_batch_size: int = 8, max_wait_ms: float = 10.0,
+                 max_workers: int = 1, max_queue: int = 0):
+        self.predictor = predictor
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.max_workers = max(1, int(max_workers))
+        self.max_queue = max(0, int(max_queue))  # 0 = unbounded
+
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._running = set()
+
+        # Counters for health reporting
+        self.batches_run = 0
+        self.items_processed = 0
+        self.largest_batch = 0
+        self.rejected = 0
+        self.isolated_batches = 0
+        self.total_wait_ms = 0.0
+
+    async def start(self):
+        if self._worker is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="inference")
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.max_workers)
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+        # Let in-flight batches finish, then fail anything still waiting
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+        while not self._queue.empty():
+            _fail_stopped([self._queue.get_nowait()])
+        self._executor.shutdown(wait=False)
+        self._executor = None
+
+    def depth(self) -> int:
+        """Number of images waiting for a batch slot."""
+        return self._queue.qsize() if self._queue else 0
+
+    async def submit(self, image) -> Tuple[Dict[str, Any], float]:
+        """Queue one image; returns (prediction, milliseconds spent waiting in the queue)."""
+        if self._worker is None:
+            await self.start()
+        depth = self.depth()
+        if self.max_queue and depth >= self.max_queue:
+            self.rejected += 1
+            raise QueueFullError(depth)
+
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((image, future, time.perf_counter()))
+        return await future
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "batches_run": self.batches_run,
+            "items_processed": self.items_processed,
+            "largest_batch": self.largest_batch,
+            "avg_batch_size": round(self.items_processed / self.batches_run, 2) if self.batches_run else 0.0,
+            "avg_queue_wait_ms": round(self.total_wait_ms / self.items_processed, 2) if self.items_processed else 0.0,
+            "rejected": self.rejected,
+            "isolated_batches": self.isolated_batches,
+            "queued": self.depth(),
+            "running_batches": len(self._running),
+        }
+
+    async def _collect(self) -> List[tuple]:
+        loop = asyncio.get_running_loop()
+        batch = []
+        try:
+            batch.append(await self._queue.get())
+            deadline = loop.time() + self.max_wait
+
+            while len(batch) < self.max_batch_size:
+                # Take whatever is already queued without waiting
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+        except asyncio.CancelledError:
+            # stop() while a batch was being collected: these are no longer in the queue it drains
+            _fail_stopped(batch)
+            raise
+        return batch
+
+    async def _run(self):
+        while True:
+            # Only start collecting once a worker is free, so the queue keeps
+            # filling (and batches grow) while the pool is busy
+            await self._slots.acquire()
+            try:
+                batch = await self._collect()
+            except BaseException:
+                self._slots.release()
+                raise
+            task = asyncio.create_task(self._execute(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _execute(self, batch: List[tuple]):
+        loop = asyncio.get_running_loop()
+        try:
+            # Drop callers that gave up (e.g. client disconnected) before running the model
+            batch = [entry for entry in batch if not entry[1].done()]
+            if not batch:
+                return
+
+            started = time.perf_counter()
+            waits = [(started - enqueued) * 1000.0 for _, _, enqueued in batch]
+            images = [image for image, _, _ in batch]
+            try:
+                results = await loop.run_in_executor(self._executor, self._predict, images)
+            except Exception as e:
+                logger.error(f"Batch prediction failed: {e}")
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+
+            self.batches_run += 1
+            self.items_processed += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+            self.total_wait_ms += sum(waits)
+
+            for (_, future, _), result, wait_ms in zip(batch, results, waits):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result((result, wait_ms))
+        finally:
+            self._slots.release()
+
+    def _predict(self, images: List[Any]) -> List[Any]:
+        """predict_batch(), falling back to one image at a time if the batched call fails"""
+        try:
+            return self.predictor.predict_batch(images)
+        except Exception as e:
+            if len(images) == 1:
+                return [e]
+            logger.warning(f"Batch of {len(images)} failed ({e}); retrying images one at a time")
+            self.isolated_batches += 1
+            results = []
+            for image in images:
+                if hasattr(image, "seek"):
+                    image.seek(0)  # the failed attempt may have consumed the stream
+                results.extend(self._predict([image]))
+            return results
@@ -0,0 +1,133 @@
+"""
+Micro-benchmark: per-lookup latency with and without pooled keep-alive sessions.
+
+Starts a local HTTPS stub that answers like the USDA search API (self-signed
+certificate generated with the openssl CLI), then times N lookups:
+
+- one-shot requests.get per lookup (the old behaviour: DNS + TCP + TLS every time)
+- NutritionService sync path (pooled requests.Session)
+- one-shot httpx.AsyncClient per lookup
+- NutritionService async path (pooled httpx.AsyncClient)
+
+Usage:
+    python backend/benchmark_nutrition_sessions.py --lookups 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import ssl
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import httpx
+import requests
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+USDA_RESPONSE = json.dumps({
+    "foods": [{
+        "description": "Dal",
+        "servingSize": "100g",
+        "foodNutrients": [
+            {"nutrientId": 1008, "value": 116},
+            {"nutrientId": 1003, "value": 9},
+            {"nutrientId": 1004, "value": 0.4},
+            {"nutrientId": 1005, "value": 20},
+        ]
+    }]
+}).encode()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    disable_nagle_algorithm = True  # avoid 40ms delayed-ACK stalls between header and body writes
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(USDA_RESPONSE)))
+        self.end_headers()
+        self.wfile.write(USDA_RESPONSE)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_tls_stub(workdir):
+    cert, key = os.path.join(workdir, "cert.pem"), os.path.join(workdir, "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+         "-keyout", key, "-out", cert, "-subj", "/CN=localhost",
+         "-addext", "subjectAltName=DNS:localhost"],
+        check=True, capture_output=True
+    )
+    server = ThreadingHTTPServer(("localhost", 0), StubHandler)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, cert, f"https://localhost:{server.server_port}/fdc/v1/foods/search"
+
+
+def timed(fn, n):
+    timings = []
+    for _ in range(n):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+async def timed_async(fn, n):
+    timings = []
+    for _ in range(n):
+        start = time.perf_counter()
+        await fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def report(name, timings):
+    print(f"{name:>28}: mean {statistics.mean(timings):6.2f} ms | median {statistics.median(timings):6.2f} ms")
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--lookups", type=int, default=200)
+    args = p.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        server, cert, url = start_tls_stub(workdir)
+        os.environ.update({"USDA_API_KEY": "bench", "USDA_API_URL": url, "NUTRITION_CA_BUNDLE": cert})
+        from backend.nutrition_apis import NutritionService
+        svc = NutritionService(cache_path="")
+        params = {"api_key": "bench", "query": "dal", "pageSize": 1}
+
+        print(f"{args.lookups} lookups against local TLS stub {url}")
+        report("requests.get (no pool)", timed(lambda: requests.get(url, params=params, verify=cert, timeout=5), args.lookups))
+        report("NutritionService (sync)", timed(lambda: svc._call("USDA", "dal"), args.lookups))
+
+        async def run_async():
+            context = ssl.create_default_context(cafile=cert)
+
+            async def one_shot():
+                async with httpx.AsyncClient(verify=context, timeout=5) as client:
+                    await client.get(url, params=params)
+
+            report("httpx one-shot (no pool)", await timed_async(one_shot, args.lookups))
+            report("NutritionService (async)", await timed_async(lambda: svc._call_async("USDA", "dal"), args.lookups))
+            await svc.aclose()
+
+        asyncio.run(run_async())
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Benchmark PerceptualIndex insert and lookup cost.
+
+Fills the index with random 64-bit hashes (1M by default), then times lookups
+for near-duplicates (a stored hash with a few bits flipped) and for misses.
+
+Usage:
+    python backend/benchmark_perceptual_index.py --entries 1000000 --distance 4
+"""
+import argparse
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from backend.perceptual_index import PerceptualIndex
+
+
+def flip_bits(value, count):
+    for bit in random.sample(range(64), count):
+        value ^= 1 << bit
+    return value
+
+
+def time_lookups(index, queries):
+    timings = []
+    found = 0
+    for q in queries:
+        start = time.perf_counter()
+        found += index.lookup(q) is not None
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings, found
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument('--entries', type=int, default=1_000_000)
+    p.add_argument('--distance', type=int, default=4)
+    p.add_argument('--queries', type=int, default=1000)
+    args = p.parse_args()
+
+    random.seed(0)
+    index = PerceptualIndex(capacity=args.entries, max_distance=args.distance)
+    hashes = [random.getrandbits(64) for _ in range(args.entries)]
+
+    start = time.perf_counter()
+    for i, h in enumerate(hashes):
+        index.add(h, i)
+    insert_s = time.perf_counter() - start
+    print(f"Inserted {args.entries:,} hashes in {insert_s:.1f}s ({insert_s / args.entries * 1e6:.1f} us/insert)")
+    print(f"Index arrays: {index.stats()['array_bytes'] / 1e6:.1f} MB")
+
+    near = [flip_bits(random.choice(hashes), random.randint(0, args.distance)) for _ in range(args.queries)]
+    miss = [random.getrandbits(64) for _ in range(args.queries)]
+
+    for name, queries in (("near-duplicate", near), ("miss", miss)):
+        timings, found = time_lookups(index, queries)
+        timings.sort()
+        print(f"{name:>15}: median {statistics.median(timings):.3f} ms | p99 {timings[int(len(timings) * 0.99) - 1]:.3f} ms | found {found}/{len(queries)}")
+
+
+if __name__ == '__main__':
+    main()
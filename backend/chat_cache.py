@@ -0,0 +1,196 @@
+"""
+Response cache for context-free chat questions.
+
+Much of the assistant's traffic is the same few questions ("how many calories
+in 2 chapatis", "is dal healthy"). Questions are reduced to a canonical key:
+their content words, lightly stemmed, in their original order ("calorie 2
+chapati"). Polarity words are always kept, however short ("no", "not"), and
+the order keeps numbers with their nouns and comparisons the right way round,
+so "chapati with no ghee", "2 chapatis and 3 bowls of dal" and "is roti
+better than rice" never share a key with "chapati with ghee", "3 chapatis
+and 2 bowls of dal" or "is rice better than roti".
+
+Keys are matched exactly first, then allowing spelling variants: word by
+word, each word must equal its counterpart or differ from it only by spelling
+(character-trigram Dice, the same scheme as NutritionIndex; "chapatti" vs
+"chapati"). An extra or missing word ("butter masala" vs "paneer butter
+masala") is a different question, numbers must match exactly, and a polarity
+word never counts as a spelling variant ("healthy" vs "unhealthy").
+
+Only questions that read as self-contained are cached or served: follow-ups
+that lean on earlier turns ("what about rice?", "is it healthy?") bypass the
+cache whenever the session already has history. Entries expire after ``ttl``
+seconds and the least recently used are evicted beyond ``max_entries``.
+"""
+import re
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, List, Optional
+
+STOPWORDS = {
+    "the", "and", "for", "how", "many", "much", "what", "are", "is", "in", "of", "a", "an", "to", "do",
+    "does", "can", "i", "my", "me", "you", "with", "there", "about", "tell", "please", "per",
+}
+# Words that point back at earlier turns
+CONTEXT_WORDS = {
+    "it", "its", "that", "this", "these", "those", "they", "them", "their", "he", "she", "one", "ones",
+    "same", "also", "too", "else", "more", "instead", "above", "previous", "earlier", "again",
+}
+CONTEXT_PREFIXES = ("what about", "how about", "and ", "but ", "so ", "then ", "why", "which one")
+# Words that flip or qualify the meaning of an otherwise similar question
+POLARITY_WORDS = {"not", "no", "without", "bad", "avoid", "free", "less", "low", "high", "more", "before", "after"}
+
+
+def normalize_question(text: str) -> str:
+    """'How many calories in 2 Chapatis??' -> 'how many calories in 2 chapatis'"""
+    return re.sub(r"\s+", " ", re.sub(r"[^a-z0-9 ]", " ", text.lower())).strip()
+
+
+def _trigrams(text: str):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _stem(word: str) -> str:
+    if len(word) > 4 and word.endswith("es") and not word.endswith("ses"):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def _content_words(text: str) -> List[str]:
+    return [
+        _stem(word) for word in text.split()
+        if word in POLARITY_WORDS or (word not in STOPWORDS and (len(word) > 2 or word.isdigit()))
+    ]
+
+
+def canonical_question(text: str) -> str:
+    """'How many calories in 2 Chapatis??' -> 'calorie 2 chapati'"""
+    return " ".join(_content_words(normalize_question(text)))
+
+
+def _is_polar(word: str) -> bool:
+    return word in POLARITY_WORDS or (word.startswith(("un", "non")) and len(word) > 5)
+
+
+def is_context_dependent(question: str, has_history: bool) -> bool:
+    """True if the question likely needs earlier turns to be answered"""
+    if not has_history:
+        return False
+    normalized = normalize_question(question)
+    words = normalized.split()
+    if len(words) < 3 or normalized.startswith(CONTEXT_PREFIXES):
+        return True
+    return any(word in CONTEXT_WORDS for word in words)
+
+
+class ChatResponseCache:
+    def __init__(self, ttl_seconds: float = 6 * 3600, max_entries: int = 2000, min_similarity: float = 0.8):
+        self.ttl = float(ttl_seconds)
+        self.max_entries = max(1, int(max_entries))
+        self.min_similarity = min_similarity
+
+        # canonical question -> (answer, expires, words)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._postings = defaultdict(set)  # content word -> canonical questions
+        self._lock = threading.Lock()
+
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+    def get(self, question: str, has_history: bool = False) -> Optional[str]:
+        if is_context_dependent(question, has_history):
+            with self._lock:
+                self.bypassed += 1
+            return None
+
+        key = canonical_question(question)
+        if not key:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return entry[0]
+
+            match = self._similar(key, now)
+            if match is not None:
+                self._entries.move_to_end(match)
+                self.similar_hits += 1
+                return self._entries[match][0]
+            self.misses += 1
+            return None
+
+    def set(self, question: str, answer: str, has_history: bool = False):
+        if not answer or is_context_dependent(question, has_history):
+            return
+        key = canonical_question(question)
+        if not key:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (answer, time.time() + self.ttl, tuple(key.split()))
+            for word in key.split():
+                self._postings[word].add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.exact_hits + self.similar_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "exact_hits": self.exact_hits,
+                "similar_hits": self.similar_hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "hit_rate": round((self.exact_hits + self.similar_hits) / lookups, 3) if lookups else 0.0,
+            }
+
+    def _similar(self, key, now):
+        words = tuple(key.split())
+        candidates = set()
+        for word in words:
+            candidates.update(self._postings.get(word, ()))
+
+        best, best_score = None, 0.0
+        for candidate in candidates:
+            _, expires, candidate_words = self._entries[candidate]
+            if expires <= now or len(candidate_words) != len(words):
+                continue
+            score = self._spelling_match(words, candidate_words)
+            if score is not None and score > best_score:
+                best, best_score = candidate, score
+        return best
+
+    def _spelling_match(self, words, other_words) -> Optional[float]:
+        """Lowest word similarity if each word equals or is a spelling variant of the one in the same position"""
+        lowest = 1.0
+        for word, other in zip(words, other_words):
+            if word == other:
+                continue
+            if _is_polar(word) or _is_polar(other) or word.isdigit() or other.isdigit():
+                return None
+            grams, other_grams = _trigrams(word), _trigrams(other)
+            score = 2 * len(grams & other_grams) / (len(grams) + len(other_grams))
+            if score < self.min_similarity:
+                return None
+            lowest = min(lowest, score)
+        return lowest
+
+    def _remove(self, key):
+        self._entries.pop(key)
+        for word in key.split():
+            keys = self._postings.get(word)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._postings[word]
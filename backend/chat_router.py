@@ -0,0 +1,239 @@
+"""
+Deadline-based routing between chat backends.
+
+ChatRouter.stream() starts the preferred backend and, if it has not produced a
+first token within the hedge delay, starts the next one alongside it. Whichever
+answers first wins; the others are cancelled. A backend that fails up front
+hands over immediately instead of waiting out its client timeout, and if no
+backend produces a token within ``first_token_deadline_s`` the request fails
+with ChatBackendError.
+
+Preference adapts to ChatMetrics. Backends with a poor recent success rate
+are demoted to the end. Among the rest, backends with time-to-first-token
+samples swap places by median TTFT, and backends without samples keep their
+configured position. A hedged backend cancelled before its first token has its
+wait recorded as a TTFT sample (a lower bound), so a backend that keeps losing
+the race is measured as slow rather than staying unmeasured. The success rate
+only counts once a backend has ``min_outcomes`` outcomes from the last
+``outcome_max_age_s`` seconds, so a single early error does not demote it and
+old failures age out. A demoted backend that has not been started for
+``probe_interval_s`` is probed in the background with the current request; the
+probe's outcome is recorded but its answer is discarded, so users are never
+served by a backend that is still failing. The hedge delay tightens to the
+preferred backend's p95 TTFT once that is known, so a healthy fast backend is
+rarely hedged and a stalled one is hedged early.
+
+Backends are (name, zero-argument callable returning a token async iterator),
+so the router runs against the shared Ollama/Gemini clients in production and
+against any local stand-in (a plain async generator) in tests and benchmarks.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+try:
+    from backend.chat_stream import ChatBackendError, ChatMetrics
+except ImportError:
+    from chat_stream import ChatBackendError, ChatMetrics
+
+logger = logging.getLogger(__name__)
+
+MIN_HEDGE_DELAY_S = 0.25
+
+
+async def _pump(name, open_stream, queue: asyncio.Queue):
+    """Forward one backend's tokens to the shared queue as (name, kind, value)"""
+    try:
+        async for text in open_stream():
+            queue.put_nowait((name, "token", text))
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        queue.put_nowait((name, "fail", e))
+        return
+    queue.put_nowait((name, "end", None))
+
+
+class ChatRouter:
+    def __init__(self, metrics: Optional[ChatMetrics] = None, hedge_delay_s: Optional[float] = 2.0,
+                 first_token_deadline_s: Optional[float] = 20.0, min_success_rate: float = 0.5,
+                 min_outcomes: int = 5, outcome_max_age_s: Optional[float] = 300.0,
+                 probe_interval_s: float = 30.0):
+        """
+        hedge_delay_s: 0 races all backends at once; None only falls back on failure.
+        first_token_deadline_s: None waits as long as the backends' own timeouts.
+        """
+        self.metrics = metrics or ChatMetrics()
+        self.hedge_delay_s = hedge_delay_s
+        self.first_token_deadline_s = first_token_deadline_s
+        self.min_success_rate = min_success_rate
+        self.min_outcomes = min_outcomes
+        self.outcome_max_age_s = outcome_max_age_s
+        self.probe_interval_s = probe_interval_s
+        self._last_started: Dict[str, float] = {}  # monotonic time each backend was last started
+        self._probes = set()  # running background probes
+
+        self.requests = 0
+        self.probes = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.deadline_misses = 0
+
+    def demoted(self, name: str) -> bool:
+        success_rate = self.metrics.success_rate(name, self.outcome_max_age_s, self.min_outcomes)
+        return success_rate is not None and success_rate < self.min_success_rate
+
+    def order(self, backends: List[Tuple[str, Any]]) -> List[Tuple[str, Any]]:
+        healthy = [backend for backend in backends if not self.demoted(backend[0])]
+        demoted = [backend for backend in backends if self.demoted(backend[0])]
+
+        # Measured backends trade places by median TTFT; unmeasured ones keep their slot
+        ttfts = {name: self.metrics.ttft_ms(name) for name, _ in healthy}
+        slots = [i for i, (name, _) in enumerate(healthy) if ttfts[name] is not None]
+        fastest = sorted((healthy[i] for i in slots), key=lambda backend: ttfts[backend[0]])
+        for i, backend in zip(slots, fastest):
+            healthy[i] = backend
+        return healthy + demoted
+
+    def probe_demoted(self, backends: List[Tuple[str, Any]]):
+        """Start a background probe for each demoted backend not started within probe_interval_s"""
+        now = time.monotonic()
+        for name, open_stream in backends:
+            if self.demoted(name) and now - self._last_started.get(name, 0.0) >= self.probe_interval_s:
+                # Claimed before the probe runs, so concurrent requests don't all probe it
+                self._last_started[name] = now
+                self.probes += 1
+                logger.info(f"Probing demoted chat backend {name} in the background")
+                task = asyncio.create_task(self._probe(name, open_stream))
+                self._probes.add(task)
+                task.add_done_callback(self._probes.discard)
+
+    async def _probe(self, name, open_stream):
+        started = time.perf_counter()
+        try:
+            tokens = open_stream().__aiter__()
+            await asyncio.wait_for(tokens.__anext__(), self.first_token_deadline_s)
+            ttft_ms = (time.perf_counter() - started) * 1000
+            async for _ in tokens:
+                pass
+        except asyncio.CancelledError:
+            raise
+        except BaseException as e:  # incl. StopAsyncIteration for an empty answer
+            logger.warning(f"Probe of {name} failed: {e!r}")
+            self.metrics.record_error(name)
+            return
+        self.metrics.record(name, ttft_ms, (time.perf_counter() - started) * 1000)
+
+    def hedge_delay(self, name: str) -> Optional[float]:
+        if self.hedge_delay_s is None or self.hedge_delay_s <= 0:
+            return self.hedge_delay_s
+        p95 = self.metrics.ttft_ms(name, 0.95)
+        if p95 is None:
+            return self.hedge_delay_s
+        return min(self.hedge_delay_s, max(p95 / 1000, MIN_HEDGE_DELAY_S))
+
+    async def stream(self, backends: List[Tuple[str, Any]]) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Yields ("token", text) items, then ("done", {"backend", "ttft_ms",
+        "total_ms", "hedged"}). A failure after the first token ends the stream
+        with ("error", message) since the user has already seen part of the
+        answer. Raises ChatBackendError if no backend produces a token in time.
+        """
+        self.requests += 1
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        pending = self.order(backends)
+        self.probe_demoted(backends)
+        running: Dict[str, Tuple[asyncio.Task, float]] = {}
+        deadline = loop.time() + self.first_token_deadline_s if self.first_token_deadline_s else None
+        hedged = set()  # backends started while another was still running
+
+        def launch():
+            name, open_stream = pending.pop(0)
+            if running:
+                hedged.add(name)
+                logger.info(f"Hedging chat request: starting {name} alongside {', '.join(running)}")
+            running[name] = (asyncio.create_task(_pump(name, open_stream, queue)), time.perf_counter())
+            self._last_started[name] = time.monotonic()
+            delay = self.hedge_delay(name)
+            return loop.time() + delay if delay is not None else None
+
+        try:
+            # Phase 1: until some backend produces its first token
+            winner = None
+            next_hedge = None
+            while winner is None:
+                if not running:
+                    if not pending:
+                        raise ChatBackendError("No chat backend available")
+                    next_hedge = launch()
+                while pending and next_hedge is not None and next_hedge <= loop.time():
+                    next_hedge = launch()
+
+                wake = min((t for t in (next_hedge if pending else None, deadline) if t is not None), default=None)
+                try:
+                    timeout = None if wake is None else max(0.0, wake - loop.time())
+                    name, kind, value = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    if deadline is not None and loop.time() >= deadline:
+                        self.deadline_misses += 1
+                        raise ChatBackendError(f"No chat backend answered within {self.first_token_deadline_s}s")
+                    continue  # hedge is due
+
+                if kind == "token":
+                    winner = name
+                    ttft_ms = (time.perf_counter() - running[name][1]) * 1000
+                    yield "token", value
+                    continue
+                # Failed or empty before its first token: drop it, the next one starts at once
+                logger.error(f"{name} chat error: {value if kind == 'fail' else 'empty answer'}")
+                self.metrics.record_error(name)
+                running.pop(name)[0].cancel()
+
+            if hedged:
+                self.hedges += 1
+                if winner in hedged:
+                    self.hedge_wins += 1
+            for name in [name for name in running if name != winner]:
+                task, started = running.pop(name)
+                task.cancel()
+                # Lost the race: not a failure, but it took at least this long
+                self.metrics.record_unfinished(name, (time.perf_counter() - started) * 1000)
+
+            # Phase 2: stream the winner to the end
+            while True:
+                name, kind, value = await queue.get()
+                if name != winner:
+                    continue  # leftovers from a cancelled backend
+                if kind == "token":
+                    yield "token", value
+                    continue
+                if kind == "fail":
+                    logger.error(f"{name} chat error: {value}")
+                    self.metrics.record_error(name)
+                    yield "error", f"{name} stopped mid-answer"
+                    return
+                total_ms = (time.perf_counter() - running[name][1]) * 1000
+                self.metrics.record(name, ttft_ms, total_ms)
+                yield "done", {
+                    "backend": name,
+                    "ttft_ms": round(ttft_ms, 1),
+                    "total_ms": round(total_ms, 1),
+                    "hedged": bool(hedged),
+                }
+                return
+        finally:
+            for task, _ in running.values():
+                task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "deadline_misses": self.deadline_misses,
+            "probes": self.probes,
+            "hedge_delay_s": self.hedge_delay_s,
+            "first_token_deadline_s": self.first_token_deadline_s,
+        }
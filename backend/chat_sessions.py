@@ -0,0 +1,184 @@
+"""
+Server-side chat sessions for the FoodSnap assistant.
+
+Clients send only a session id and the new message; the conversation lives
+here. Each session keeps its recent turns verbatim within ``token_budget``
+(estimated at ~4 characters per token). When a new turn pushes it over budget,
+the oldest turns are folded into a compact running summary, and recent turns
+too long to fit are truncated. The prompt therefore stays roughly the same
+size however long the chat runs.
+
+The summary is sent as an ordinary user/assistant exchange rather than a
+system message: Ollama only applies the Modelfile's SYSTEM persona when the
+conversation does not start with its own system message, and Gemini expects
+strictly alternating user/model turns. Compaction keeps the recent turns
+starting on a user turn for the same reason.
+
+Sessions idle for ``idle_ttl_s`` are dropped, and the least recently used ones
+are evicted whenever the store exceeds ``max_sessions`` or ``max_bytes``.
+"""
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+CHARS_PER_TOKEN = 4
+TRUNCATION_MARK = " [...]"
+SUMMARY_ACK = "Understood, I'll keep our earlier conversation in mind."
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    limit = max(0, (max_tokens - 1) * CHARS_PER_TOKEN - len(TRUNCATION_MARK))
+    return text if estimate_tokens(text) <= max_tokens else text[:limit].rstrip() + TRUNCATION_MARK
+
+
+def summarize_turns(summary: str, turns: List[Dict[str, str]], max_tokens: int) -> str:
+    """
+    Extractive summary: the first sentence of each folded turn, appended to the
+    previous summary, keeping the most recent max_tokens worth. Cheap and local,
+    so compaction never costs an extra model call.
+    """
+    lines = [summary] if summary else []
+    for turn in turns:
+        first = re.split(r"(?<=[.!?])\s", turn["content"].strip(), maxsplit=1)[0]
+        speaker = "User" if turn["role"] == "user" else "Assistant"
+        lines.append(f"{speaker}: {first[:200]}")
+    text = "\n".join(lines)
+    limit = max_tokens * CHARS_PER_TOKEN
+    if len(text) > limit:
+        text = text[-limit:].split("\n", 1)[-1]
+    return text
+
+
+class ChatSession:
+    def __init__(self, session_id: str):
+        self.id = session_id
+        self.summary = ""
+        self.turns: List[Dict[str, str]] = []
+        self.last_used = time.monotonic()
+
+    @property
+    def tokens(self) -> int:
+        return estimate_tokens(self.summary) + sum(estimate_tokens(t["content"]) for t in self.turns)
+
+    @property
+    def size_bytes(self) -> int:
+        return len(self.summary) + sum(len(t["content"]) + len(t["role"]) for t in self.turns)
+
+
+class ChatSessionStore:
+    def __init__(self, token_budget: int = 1500, summary_tokens: int = 300, keep_recent_turns: int = 4,
+                 idle_ttl_s: float = 1800.0, max_sessions: int = 10000, max_bytes: int = 64 * 1024 * 1024):
+        self.token_budget = token_budget
+        self.summary_tokens = summary_tokens
+        self.keep_recent_turns = max(1, keep_recent_turns)
+        self.idle_ttl_s = idle_ttl_s
+        self.max_sessions = max(1, max_sessions)
+        self.max_bytes = max_bytes
+
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.created = 0
+        self.compactions = 0
+        self.truncations = 0
+        self.evicted_idle = 0
+        self.evicted_memory = 0
+
+    def get_or_create(self, session_id: Optional[str] = None) -> ChatSession:
+        """Existing session (refreshing its idle timer), or a new one with a fresh id"""
+        with self._lock:
+            self._evict_idle()
+            session = self._sessions.get(session_id) if session_id else None
+            if session is None:
+                session = ChatSession(uuid.uuid4().hex)
+                self._sessions[session.id] = session
+                self.created += 1
+                self._evict_over_limit(keep=session.id)
+            self._sessions.move_to_end(session.id)
+            session.last_used = time.monotonic()
+            return session
+
+    def messages(self, session: ChatSession) -> List[Dict[str, str]]:
+        """Prompt history: the running summary (if any) then the recent turns, always opening on a user turn"""
+        with self._lock:
+            history = []
+            if session.summary:
+                history.append({"role": "user", "content": f"Summary of our earlier conversation:\n{session.summary}"})
+                history.append({"role": "assistant", "content": SUMMARY_ACK})
+            turns = session.turns
+            start = next((i for i, turn in enumerate(turns) if turn["role"] == "user"), len(turns))
+            history.extend(dict(turn) for turn in turns[start:])
+            return history
+
+    def append(self, session: ChatSession, role: str, content: str):
+        with self._lock:
+            before = session.size_bytes
+            session.turns.append({"role": role, "content": content})
+            session.last_used = time.monotonic()
+            if session.tokens > self.token_budget and len(session.turns) > self.keep_recent_turns:
+                split = len(session.turns) - self.keep_recent_turns
+                if session.turns[split]["role"] != "user" and split + 1 < len(session.turns):
+                    split += 1  # keep the recent turns starting on a user turn
+                folded = session.turns[:split]
+                session.turns = session.turns[split:]
+                session.summary = summarize_turns(session.summary, folded, self.summary_tokens)
+                self.compactions += 1
+            if session.tokens > self.token_budget:
+                self._truncate(session)
+            if session.id in self._sessions:
+                self._bytes += session.size_bytes - before
+                self._evict_over_limit(keep=session.id)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "bytes": self._bytes,
+                "created": self.created,
+                "compactions": self.compactions,
+                "truncations": self.truncations,
+                "evicted_idle": self.evicted_idle,
+                "evicted_memory": self.evicted_memory,
+            }
+
+    def _truncate(self, session: ChatSession):
+        """Shorten the longest recent turns until the session fits its budget"""
+        remaining = self.token_budget - estimate_tokens(session.summary)
+        ordered = sorted(session.turns, key=lambda turn: len(turn["content"]))
+        for i, turn in enumerate(ordered):
+            # Short turns stay whole; what they leave over is shared by the longer ones
+            share = max(1, remaining // (len(ordered) - i))
+            if estimate_tokens(turn["content"]) > share:
+                turn["content"] = truncate_to_tokens(turn["content"], share)
+                self.truncations += 1
+            remaining -= estimate_tokens(turn["content"])
+
+    def _drop(self, session_id):
+        session = self._sessions.pop(session_id)
+        self._bytes -= session.size_bytes
+
+    def _evict_idle(self):
+        cutoff = time.monotonic() - self.idle_ttl_s
+        # Oldest-used first, so stop at the first session that is still fresh
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if session.last_used > cutoff:
+                break
+            self._drop(session_id)
+            self.evicted_idle += 1
+
+    def _evict_over_limit(self, keep: str):
+        while len(self._sessions) > 1 and (len(self._sessions) > self.max_sessions or self._bytes > self.max_bytes):
+            session_id = next(iter(self._sessions))
+            if session_id == keep:
+                break
+            self._drop(session_id)
+            self.evicted_memory += 1
@@ -0,0 +1,108 @@
+"""
+Token streaming for the FoodSnap assistant.
+
+stream_ollama() and stream_gemini() yield the answer as it is generated, from
+the local Ollama model through the async client (``stream=True``) and from
+Gemini's streamed output; ChatRouter (chat_router.py) chooses between them.
+Nothing here blocks the event loop. Time-to-first-token (TTFT) and total
+generation time are recorded per backend and reported by ChatMetrics.stats().
+
+sse_event() formats one server-sent event; /api/chat/stream emits
+``token`` events ({"text": ...}) followed by one ``done`` event with the
+backend used and its timings (or an ``error`` event).
+"""
+import json
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+FALLBACK_MESSAGE = (
+    "I'm having trouble connecting to my knowledge base right now. Please try again in a moment, "
+    "or feel free to upload a food photo for analysis!"
+)
+
+
+class ChatBackendError(Exception):
+    """Raised when no backend produced a token."""
+
+
+class ChatMetrics:
+    """Rolling TTFT / total-time samples per backend"""
+
+    def __init__(self, window: int = 200):
+        self._samples: Dict[str, deque] = {}
+        self._errors: Dict[str, int] = {}
+        self._outcomes: Dict[str, deque] = {}  # recent (monotonic time, success), for routing
+        self._window = window
+        self._lock = threading.Lock()
+
+    def record(self, backend: str, ttft_ms: float, total_ms: float):
+        with self._lock:
+            self._samples.setdefault(backend, deque(maxlen=self._window)).append((ttft_ms, total_ms))
+            self._outcomes.setdefault(backend, deque(maxlen=self._window)).append((time.monotonic(), True))
+
+    def record_unfinished(self, backend: str, waited_ms: float):
+        """A hedged backend cancelled before its first token: its TTFT was at least waited_ms"""
+        with self._lock:
+            self._samples.setdefault(backend, deque(maxlen=self._window)).append((waited_ms, None))
+
+    def record_error(self, backend: str):
+        with self._lock:
+            self._errors[backend] = self._errors.get(backend, 0) + 1
+            self._outcomes.setdefault(backend, deque(maxlen=self._window)).append((time.monotonic(), False))
+
+    def ttft_ms(self, backend: str, quantile: float = 0.5) -> Optional[float]:
+        with self._lock:
+            ttfts = sorted(s[0] for s in self._samples.get(backend, ()))
+        return ttfts[min(len(ttfts) - 1, int(len(ttfts) * quantile))] if ttfts else None
+
+    def success_rate(self, backend: str, max_age_s: Optional[float] = None,
+                     min_outcomes: int = 1) -> Optional[float]:
+        """None when fewer than min_outcomes outcomes are younger than max_age_s"""
+        cutoff = time.monotonic() - max_age_s if max_age_s is not None else float("-inf")
+        with self._lock:
+            outcomes = [ok for at, ok in self._outcomes.get(backend, ()) if at >= cutoff]
+        return sum(outcomes) / len(outcomes) if outcomes and len(outcomes) >= min_outcomes else None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out = {}
+            for backend in set(self._samples) | set(self._errors):
+                samples = self._samples.get(backend, ())
+                ttfts = sorted(s[0] for s in samples)
+                totals = sorted(s[1] for s in samples if s[1] is not None)
+                out[backend] = {
+                    "responses": len(totals),
+                    "errors": self._errors.get(backend, 0),
+                    "p50_ttft_ms": round(ttfts[len(ttfts) // 2], 1) if ttfts else None,
+                    "p95_ttft_ms": round(ttfts[int(len(ttfts) * 0.95)], 1) if ttfts else None,
+                    "p50_total_ms": round(totals[len(totals) // 2], 1) if totals else None,
+                }
+            return out
+
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def stream_ollama(client, model: str, messages: List[Dict[str, str]],
+                        options: Optional[Dict[str, Any]] = None, keep_alive=None) -> AsyncIterator[str]:
+    async for chunk in await client.chat(model=model, messages=messages, options=options, stream=True,
+                                         keep_alive=keep_alive):
+        text = chunk["message"]["content"]
+        if text:
+            yield text
+
+
+async def stream_gemini(model, history: List[Dict[str, str]], message: str) -> AsyncIterator[str]:
+    # Gemini only knows "user" and "model"; session history already alternates between them
+    chat = model.start_chat(history=[
+        {"role": "model" if msg["role"] == "assistant" else "user", "parts": [msg["content"]]}
+        for msg in history
+    ])
+    response = await chat.send_message_async(message, stream=True)
+    async for chunk in response:
+        text = getattr(chunk, "text", "")
+        if text:
+            yield text
@@ -0,0 +1,116 @@
+"""
+Keeps the Ollama chat model resident so user requests never pay a cold load.
+
+ChatModelWarmer.preload() asks Ollama to load the model with an empty prompt
+(no tokens are generated) and a ``keep_alive`` that holds it in memory. The
+keep-warm task then checks ``/api/ps`` every ``interval_s`` seconds: a resident
+model gets its keep_alive refreshed, an evicted one (idle timeout, Ollama
+restart, memory pressure) is loaded again. ``resident`` is what readiness
+reports, so traffic only arrives once the model is loaded.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+
+def parse_keep_alive(value: Optional[str]) -> Union[str, float, None]:
+    """'30m' / '-1' / '600' -> what the Ollama API accepts (duration string or seconds)"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+def _same_model(name: str, model: str) -> bool:
+    # Ollama reports "foodsnap-assistant:latest" for a model requested as "foodsnap-assistant"
+    return name == model or (":" not in model and name == f"{model}:latest")
+
+
+class ChatModelWarmer:
+    def __init__(self, client, model: str, keep_alive: Union[str, float, None] = "30m",
+                 interval_s: float = 240.0, preload_timeout_s: float = 120.0):
+        self.client = client
+        self.model = model
+        self.keep_alive = keep_alive
+        self.interval_s = interval_s
+        self.preload_timeout_s = preload_timeout_s
+
+        self.resident = False
+        self._task: Optional[asyncio.Task] = None
+
+        self.loads = 0
+        self.failures = 0
+        self.evictions = 0
+        self.last_load_ms: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    async def start(self):
+        """Preload now (bounded by preload_timeout_s), then keep the model warm in the background"""
+        await self.preload()
+        if self.interval_s > 0:
+            self._task = asyncio.create_task(self._keep_warm())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def preload(self) -> bool:
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(
+                self.client.generate(model=self.model, prompt="", keep_alive=self.keep_alive),
+                timeout=self.preload_timeout_s
+            )
+        except Exception as e:
+            self.resident = False
+            self.failures += 1
+            self.last_error = str(e) or type(e).__name__
+            logger.warning(f"Chat model preload failed for {self.model}: {self.last_error}")
+            return False
+        self.resident = True
+        self.loads += 1
+        self.last_load_ms = round((time.perf_counter() - started) * 1000, 1)
+        self.last_error = None
+        return True
+
+    async def check(self) -> bool:
+        """True if Ollama currently has the model loaded"""
+        try:
+            response = await asyncio.wait_for(self.client.ps(), timeout=self.preload_timeout_s)
+            self.resident = any(_same_model(m["model"] or m["name"] or "", self.model) for m in response["models"])
+        except Exception as e:
+            self.resident = False
+            self.last_error = str(e) or type(e).__name__
+        return self.resident
+
+    async def _keep_warm(self):
+        while True:
+            await asyncio.sleep(self.interval_s)
+            was_resident = self.resident
+            if not await self.check() and was_resident:
+                self.evictions += 1
+                logger.warning(f"Chat model {self.model} was unloaded, reloading")
+            # Loading a resident model is a no-op apart from resetting its keep_alive timer
+            await self.preload()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "resident": self.resident,
+            "keep_alive": self.keep_alive,
+            "loads": self.loads,
+            "failures": self.failures,
+            "evictions": self.evictions,
+            "last_load_ms": self.last_load_ms,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,101 @@
+"""
+Circuit breaker for upstream nutrition providers.
+
+Each breaker keeps a rolling window of the last ``window_size`` calls. A call
+counts as bad when it errors or takes longer than ``slow_call_s``. Once at least
+``min_calls`` are recorded and the bad-call ratio reaches ``error_threshold``,
+the breaker opens and the provider is skipped immediately. After
+``open_seconds`` it goes half-open and lets a single probe call through: a good
+probe closes the breaker, a bad one re-opens it.
+"""
+import threading
+import time
+from collections import deque
+from typing import Any, Dict
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, window_size: int = 20, min_calls: int = 5, error_threshold: float = 0.5,
+                 slow_call_s: float = 2.5, open_seconds: float = 30.0):
+        self.name = name
+        self.window_size = max(1, int(window_size))
+        self.min_calls = max(1, int(min_calls))
+        self.error_threshold = error_threshold
+        self.slow_call_s = slow_call_s
+        self.open_seconds = open_seconds
+
+        self.state = CLOSED
+        self._window = deque(maxlen=self.window_size)  # (ok, latency_s)
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+        self.skipped = 0
+        self.times_opened = 0
+
+    def allow(self) -> bool:
+        """True if a call may go out now. In half-open state only one probe is allowed."""
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self._opened_at < self.open_seconds:
+                    self.skipped += 1
+                    return False
+                self.state = HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == HALF_OPEN:
+                if self._probe_in_flight:
+                    self.skipped += 1
+                    return False
+                self._probe_in_flight = True
+            return True
+
+    def record(self, success: bool, latency_s: float):
+        ok = success and latency_s <= self.slow_call_s
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probe_in_flight = False
+                if ok:
+                    self.state = CLOSED
+                    self._window.clear()
+                else:
+                    self._open()
+                return
+
+            self._window.append((ok, latency_s))
+            if len(self._window) >= self.min_calls and self._bad_ratio() >= self.error_threshold:
+                self._open()
+
+    def release(self):
+        """The allowed call was abandoned (e.g. cancelled) without an outcome."""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probe_in_flight = False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            latencies = sorted(latency for _, latency in self._window)
+            return {
+                "state": self.state,
+                "calls_in_window": len(self._window),
+                "error_rate": round(self._bad_ratio(), 3),
+                "p50_latency_ms": round(latencies[len(latencies) // 2] * 1000, 1) if latencies else None,
+                "max_latency_ms": round(latencies[-1] * 1000, 1) if latencies else None,
+                "skipped": self.skipped,
+                "times_opened": self.times_opened,
+                "retry_in_s": round(max(0.0, self._opened_at + self.open_seconds - time.monotonic()), 1)
+                if self.state == OPEN else 0.0,
+            }
+
+    def _bad_ratio(self):
+        if not self._window:
+            return 0.0
+        return sum(1 for ok, _ in self._window if not ok) / len(self._window)
+
+    def _open(self):
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self.times_opened += 1
@@ -0,0 +1,190 @@
+"""
+Paged, projected reads of prediction history with a short-TTL read-through cache.
+
+Pages are ordered newest first by (timestamp, document id). The cursor handed
+to clients encodes the last entry's timestamp and id, so the next page starts
+right after it without re-reading that document. List views only fetch the
+fields they display (``LIST_FIELDS``); ``detected_items`` and other fields are
+projected in on request. Rendered pages are cached for a few seconds, so
+repeated app opens do not re-query Firestore; new history writes invalidate
+the cache.
+
+Full exports (iter_history / export_ndjson / export_csv) walk the same cursor
+chain oldest first, one page at a time, so memory stays constant however long
+the meal log is. Every exported row carries the cursor that resumes after it.
+"""
+import base64
+import csv
+import io
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from firebase_admin import firestore
+
+LIST_FIELDS = ["timestamp", "image_url", "thumbnail_url", "total_calories", "confidence"]
+ALL_FIELDS = LIST_FIELDS + ["medium_url", "detected_items", "is_mock"]
+MAX_PAGE_SIZE = 100
+EXPORT_PAGE_SIZE = 500
+CSV_COLUMNS = ["id", "timestamp", "total_calories", "confidence", "items", "image_url", "thumbnail_url", "cursor"]
+
+
+class InvalidCursorError(ValueError):
+    """Raised when a start_after cursor cannot be decoded."""
+
+
+def encode_cursor(timestamp: Optional[datetime], doc_id: str) -> str:
+    payload = json.dumps({"t": timestamp.isoformat() if timestamp else None, "id": doc_id})
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Optional[datetime], str]:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        timestamp = datetime.fromisoformat(payload["t"]) if payload["t"] else None
+        return timestamp, str(payload["id"])
+    except (ValueError, KeyError, TypeError) as e:
+        raise InvalidCursorError(f"Invalid cursor: {cursor}") from e
+
+
+def parse_fields(fields: Optional[str]) -> List[str]:
+    """Comma-separated field list -> projection (defaults to LIST_FIELDS)"""
+    if not fields:
+        return list(LIST_FIELDS)
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in requested if field not in ALL_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    # The timestamp is always needed to build the next cursor
+    return ["timestamp"] + [field for field in dict.fromkeys(requested) if field != "timestamp"]
+
+
+def _page_query(db, collection, fields, descending, start_after, since=None, until=None):
+    direction = firestore.Query.DESCENDING if descending else firestore.Query.ASCENDING
+    if "thumbnail_url" in fields and "image_url" not in fields:
+        fields = fields + ["image_url"]  # thumbnail fallback for older records; dropped again in _render
+    query = db.collection(collection).select(fields)
+    if since is not None:
+        query = query.where("timestamp", ">=", since)
+    if until is not None:
+        query = query.where("timestamp", "<", until)
+    query = query.order_by("timestamp", direction=direction).order_by("__name__", direction=direction)
+    if start_after:
+        timestamp, doc_id = decode_cursor(start_after)
+        query = query.start_after({"timestamp": timestamp, "__name__": db.collection(collection).document(doc_id)})
+    return query
+
+
+def _render(doc, fields) -> Tuple[Dict[str, Any], str]:
+    """(JSON-ready record, cursor pointing just after it)"""
+    data = doc.to_dict()
+    cursor = encode_cursor(data.get("timestamp"), doc.id)
+    data["id"] = doc.id
+    if data.get("timestamp"):
+        data["timestamp"] = data["timestamp"].isoformat()
+    if "thumbnail_url" in fields:
+        # Lists should load the small preview; records from before thumbnails only have the original
+        data["thumbnail_url"] = data.get("thumbnail_url") or data.get("image_url")
+        if "image_url" not in fields:
+            data.pop("image_url", None)
+    return data, cursor
+
+
+def fetch_history_page(db, limit: int, start_after: Optional[str], fields: List[str],
+                       collection: str = "predictions") -> Dict[str, Any]:
+    query = _page_query(db, collection, fields, True, start_after)
+    history = []
+    cursor = None
+    for doc in query.limit(limit).stream():
+        data, cursor = _render(doc, fields)
+        history.append(data)
+
+    next_cursor = cursor if history and len(history) == limit else None
+    return {"history": history, "next_cursor": next_cursor}
+
+
+def iter_history(db, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                 start_after: Optional[str] = None, fields: Optional[List[str]] = None,
+                 page_size: int = EXPORT_PAGE_SIZE, collection: str = "predictions") -> Iterator[Tuple[Dict[str, Any], str]]:
+    """Yield (record, cursor) oldest first in [since, until), fetching page_size documents at a time"""
+    fields = fields or ALL_FIELDS
+    while True:
+        query = _page_query(db, collection, fields, False, start_after, since, until)
+        count = 0
+        for doc in query.limit(page_size).stream():
+            data, start_after = _render(doc, fields)
+            count += 1
+            yield data, start_after
+        if count < page_size:
+            return
+
+
+def export_ndjson(rows: Iterator[Tuple[Dict[str, Any], str]]) -> Iterator[str]:
+    for data, cursor in rows:
+        yield json.dumps({**data, "cursor": cursor}, default=str) + "\n"
+
+
+def export_csv(rows: Iterator[Tuple[Dict[str, Any], str]]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=CSV_COLUMNS, extrasaction="ignore")
+    writer.writeheader()
+    yield buffer.getvalue()
+    for data, cursor in rows:
+        buffer.seek(0)
+        buffer.truncate()
+        items = "; ".join(item.get("food", "") for item in data.get("detected_items") or [])
+        writer.writerow({**data, "items": items, "cursor": cursor})
+        yield buffer.getvalue()
+
+
+class HistoryCache:
+    """Small TTL + LRU cache of rendered history pages"""
+
+    def __init__(self, ttl_seconds: float = 15.0, max_entries: int = 256):
+        self.ttl = float(ttl_seconds)
+        self.max_entries = max(1, int(max_entries))
+        self._pages: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get_or_load(self, key: tuple, load) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._pages.get(key)
+            if entry is not None and entry[1] > now:
+                self._pages.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            generation = self.invalidations
+
+        page = load()
+        with self._lock:
+            # Don't cache a page read before a concurrent invalidation
+            if self.ttl > 0 and generation == self.invalidations:
+                self._pages[key] = (page, now + self.ttl)
+                self._pages.move_to_end(key)
+                while len(self._pages) > self.max_entries:
+                    self._pages.popitem(last=False)
+        return page
+
+    def invalidate(self):
+        with self._lock:
+            self._pages.clear()
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._pages),
+                "ttl_s": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,160 @@
+"""
+Content-addressed image storage for /predict uploads.
+
+Objects are named by the SHA-256 of their bytes (``uploads/<sha256>.jpg``), so
+the same photo uploaded twice maps to one object and the second upload is
+skipped. Derivatives (thumbnails) live next to it under the same hash
+(``uploads/thumbnail/<sha256>.webp``). Two backends share the interface:
+
+- GCSImageStore: Google Cloud Storage. Large images go through resumable
+  uploads in ``chunk_size`` pieces; creation uses ``if_generation_match=0`` so
+  concurrent writers of the same content never overwrite each other.
+- LocalImageStore: a directory on disk, for local development, tests and
+  benchmarks without GCS. URLs point at ``base_url``, by default the API's own
+  ``/images`` mount.
+"""
+import hashlib
+import io
+import logging
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONS = {"image/jpeg": ".jpg", "image/jpg": ".jpg", "image/png": ".png", "image/webp": ".webp"}
+
+# GCS resumable uploads need a chunk size that is a multiple of 256 KiB
+RESUMABLE_CHUNK = 256 * 1024
+
+
+class ImageStore:
+    """Shared naming, dedup bookkeeping and stats; subclasses implement _exists, _write and url"""
+
+    def __init__(self, prefix: str = "uploads", known_limit: int = 10000):
+        self.prefix = prefix.strip("/")
+        self.known_limit = known_limit
+        self._known = set()  # names confirmed to exist, skips repeat existence checks
+        self._lock = threading.Lock()
+
+        self.uploaded = 0
+        self.deduplicated = 0
+        self.bytes_uploaded = 0
+
+    def key(self, data: bytes, content_type: Optional[str] = None) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        return f"{self.prefix}/{digest}{EXTENSIONS.get(content_type, '')}"
+
+    def derivative_key(self, name: str, label: str, extension: str = ".webp") -> str:
+        digest = os.path.splitext(os.path.basename(name))[0]
+        return f"{self.prefix}/{label}/{digest}{extension}"
+
+    def url(self, name: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def has(self, name: str) -> bool:
+        with self._lock:
+            if name in self._known:
+                return True
+        return self._exists(name)
+
+    def put(self, name: str, data: bytes, content_type: Optional[str] = None) -> bool:
+        """Store data under name unless it already exists; True if bytes were written"""
+        if self.has(name):
+            self._remember(name, deduplicated=True)
+            return False
+        written = self._write(name, data, content_type)
+        if written:
+            with self._lock:
+                self.bytes_uploaded += len(data)
+        self._remember(name, deduplicated=not written)
+        return written
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": type(self).__name__,
+                "uploaded": self.uploaded,
+                "deduplicated": self.deduplicated,
+                "bytes_uploaded": self.bytes_uploaded,
+            }
+
+    def _remember(self, name, deduplicated):
+        with self._lock:
+            if deduplicated:
+                self.deduplicated += 1
+            else:
+                self.uploaded += 1
+            if len(self._known) >= self.known_limit:
+                self._known.clear()
+            self._known.add(name)
+
+    def _exists(self, name: str) -> bool:
+        raise NotImplementedError
+
+    def _write(self, name: str, data: bytes, content_type: Optional[str]) -> bool:
+        """Write the object; False if another writer created it first"""
+        raise NotImplementedError
+
+
+class GCSImageStore(ImageStore):
+    def __init__(self, bucket, prefix: str = "uploads", resumable_threshold: int = 5 * 1024 * 1024,
+                 chunk_size: int = 8 * RESUMABLE_CHUNK):
+        super().__init__(prefix)
+        self.bucket = bucket
+        self.resumable_threshold = resumable_threshold
+        self.chunk_size = max(1, chunk_size // RESUMABLE_CHUNK) * RESUMABLE_CHUNK
+
+    def url(self, name: str) -> Optional[str]:
+        return self.bucket.blob(name).public_url
+
+    def _exists(self, name: str) -> bool:
+        return self.bucket.blob(name).exists()
+
+    def _write(self, name, data, content_type):
+        # Large files: chunked resumable session; small ones: a single request
+        blob = self.bucket.blob(name, chunk_size=self.chunk_size if len(data) >= self.resumable_threshold else None)
+        try:
+            blob.upload_from_file(io.BytesIO(data), content_type=content_type, size=len(data), if_generation_match=0)
+        except Exception as e:
+            if getattr(e, "code", None) == 412:  # PreconditionFailed: same content already stored
+                return False
+            raise
+        return True
+
+
+class LocalImageStore(ImageStore):
+    def __init__(self, root: str, base_url: str = "/images", prefix: str = "uploads", chunk_size: int = 1024 * 1024):
+        super().__init__(prefix)
+        self.root = Path(root)
+        self.base_url = base_url.rstrip("/")
+        self.chunk_size = chunk_size
+
+    def path(self, name: str) -> Path:
+        return self.root / name
+
+    def url(self, name: str) -> Optional[str]:
+        return f"{self.base_url}/{name}"
+
+    def _exists(self, name: str) -> bool:
+        return self.path(name).exists()
+
+    def _write(self, name, data, content_type):
+        target = self.path(name)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        # Stream into a temp file, then atomically link it into place
+        fd, tmp_path = tempfile.mkstemp(dir=target.parent, prefix=".upload-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                view = memoryview(data)
+                for start in range(0, len(view), self.chunk_size):
+                    f.write(view[start:start + self.chunk_size])
+            try:
+                os.link(tmp_path, target)  # fails if another writer got there first
+            except FileExistsError:
+                return False
+            return True
+        finally:
+            os.unlink(tmp_path)
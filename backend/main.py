@@ -4,10 +4,13 @@ import shutil
 from datetime import datetime
 from typing import List, Optional
 import time
+import asyncio
 
-from fastapi import FastAPI, File, UploadFile, HTTPException, Depends, Request
+from fastapi import FastAPI, File, UploadFile, HTTPException, Depends, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 from dotenv import load_dotenv
 import ollama
@@ -26,12 +29,26 @@ import google.generativeai as genai
 # ML Inference (Importing from sibling directory requires sys.path hack or proper packaging)
 import sys
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
-<<<<<<< HEAD
-from ml.food_predictor import FoodPredictor, get_nutrition_data
-=======
-from ml.inference import FoodPredictor
->>>>>>> 9ce856a3b07268dd31a699b2dc2f080368e608f4
+from ml.food_predictor import FoodPredictor
+from ml.inference import FoodPredictor as MockableFoodPredictor
+from ml.image_decode import InvalidImageError
 from backend.nutrition_apis import NutritionService
+from backend.batching import BatchScheduler, QueueFullError
+from backend.prediction_cache import PredictionCache
+from backend.perceptual_index import PerceptualIndex, dhash
+from backend.persistence import PersistenceQueue, PersistJob
+from backend.image_store import GCSImageStore, LocalImageStore
+from backend.chat_stream import (
+    ChatMetrics, ChatBackendError, FALLBACK_MESSAGE, sse_event, stream_ollama, stream_gemini
+)
+from backend.chat_router import ChatRouter
+from backend.chat_sessions import ChatSessionStore
+from backend.chat_cache import ChatResponseCache
+from backend.chat_warmup import ChatModelWarmer, parse_keep_alive
+from backend.history import (
+    HistoryCache, InvalidCursorError, MAX_PAGE_SIZE, fetch_history_page, parse_fields,
+    iter_history, decode_cursor, export_ndjson, export_csv
+)
 
 # --- Configuration ---
 app = FastAPI(title="FoodSnap API", description="Food Recognition Backend")
@@ -52,10 +69,104 @@ MODEL_BUCKET_NAME = os.getenv("MODEL_BUCKET_NAME", "food-snap-models")
 MODEL_FILENAME = os.getenv("MODEL_FILENAME", "latest_model.keras")
 PROJECT_ID = os.getenv("GOOGLE_CLOUD_PROJECT", "food-snap-project")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "8"))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "10"))
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "1"))
+INFERENCE_QUEUE_MAX = int(os.getenv("INFERENCE_QUEUE_MAX", "64"))
+FAST_DECODE = os.getenv("FAST_DECODE", "false").lower() == "true"
+MODEL_VERSION = os.getenv("MODEL_VERSION")
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "1024"))
+PREDICTION_CACHE_TTL = float(os.getenv("PREDICTION_CACHE_TTL", "86400"))
+PREDICTION_CACHE_DB = os.getenv("PREDICTION_CACHE_DB")
+NEAR_DUP_MAX_DISTANCE = int(os.getenv("NEAR_DUP_MAX_DISTANCE", "4"))  # -1 disables
+NEAR_DUP_INDEX_SIZE = int(os.getenv("NEAR_DUP_INDEX_SIZE", "100000"))
+NUTRITION_DEADLINE_S = float(os.getenv("NUTRITION_DEADLINE_S", "6"))
+NUTRITION_HEDGE_DELAY_S = float(os.getenv("NUTRITION_HEDGE_DELAY_S", "0.5"))
+# Budget for resolving every item on a plate; late items use the local table
+NUTRITION_TOTAL_DEADLINE_S = float(os.getenv("NUTRITION_TOTAL_DEADLINE_S", "7"))
+# Look up every model class at startup (in the background) so first requests hit the cache
+NUTRITION_WARMUP = os.getenv("NUTRITION_WARMUP", "false").lower() == "true"
+NUTRITION_WARMUP_CONCURRENCY = int(os.getenv("NUTRITION_WARMUP_CONCURRENCY", "4"))
+
+# Uploaded images: "gcs" (default when GCS is available) or "local" (directory on disk)
+IMAGE_STORE = os.getenv("IMAGE_STORE", "gcs").lower()
+LOCAL_IMAGE_DIR = os.getenv("LOCAL_IMAGE_DIR", "local_uploads")
+LOCAL_IMAGE_BASE_URL = os.getenv("LOCAL_IMAGE_BASE_URL", "/images")
+
+# Write-behind persistence of uploads and history (off the request path)
+PERSIST_BATCH_SIZE = int(os.getenv("PERSIST_BATCH_SIZE", "50"))
+PERSIST_MAX_WAIT_MS = float(os.getenv("PERSIST_MAX_WAIT_MS", "200"))
+PERSIST_UPLOAD_WORKERS = int(os.getenv("PERSIST_UPLOAD_WORKERS", "4"))
+PERSIST_MAX_RETRIES = int(os.getenv("PERSIST_MAX_RETRIES", "3"))
+# Jobs waiting to be written (each holds an upload); /predict waits up to PERSIST_SUBMIT_TIMEOUT_S when full
+PERSIST_MAX_QUEUE = int(os.getenv("PERSIST_MAX_QUEUE", "200"))
+PERSIST_SUBMIT_TIMEOUT_S = float(os.getenv("PERSIST_SUBMIT_TIMEOUT_S", "2"))
+# WebP derivatives generated by the persistence worker (longest side in px; 0 disables)
+THUMBNAIL_SIZE = int(os.getenv("THUMBNAIL_SIZE", "256"))
+MEDIUM_IMAGE_SIZE = int(os.getenv("MEDIUM_IMAGE_SIZE", "0"))
+THUMBNAIL_QUALITY = int(os.getenv("THUMBNAIL_QUALITY", "80"))
+# Rendered /history pages are reused for this long (0 disables); new records invalidate them
+HISTORY_CACHE_TTL = float(os.getenv("HISTORY_CACHE_TTL", "15"))
+
+# Local image store is served by the API itself under /images (LOCAL_IMAGE_BASE_URL can make URLs absolute)
+if IMAGE_STORE == "local":
+    os.makedirs(LOCAL_IMAGE_DIR, exist_ok=True)
+    app.mount("/images", StaticFiles(directory=LOCAL_IMAGE_DIR), name="images")
+
+# Chat assistant
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "foodsnap-assistant")
+OLLAMA_TIMEOUT_S = float(os.getenv("OLLAMA_TIMEOUT_S", "30"))
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-pro")
+# Start the next backend if the preferred one has no first token after CHAT_HEDGE_DELAY_S
+# (0 races them, negative only falls back on failure); give up after CHAT_FIRST_TOKEN_DEADLINE_S
+CHAT_HEDGE_DELAY_S = float(os.getenv("CHAT_HEDGE_DELAY_S", "2.0"))
+CHAT_FIRST_TOKEN_DEADLINE_S = float(os.getenv("CHAT_FIRST_TOKEN_DEADLINE_S", "20"))
+# Load the chat model at startup and keep it resident (OLLAMA_KEEP_ALIVE: "30m", seconds, or -1 for forever)
+# Opt-in: the default container has no Ollama server
+OLLAMA_PRELOAD = os.getenv("OLLAMA_PRELOAD", "false").lower() == "true"
+OLLAMA_KEEP_ALIVE = parse_keep_alive(os.getenv("OLLAMA_KEEP_ALIVE", "30m"))
+OLLAMA_KEEP_WARM_S = float(os.getenv("OLLAMA_KEEP_WARM_S", "240"))
+OLLAMA_PRELOAD_TIMEOUT_S = float(os.getenv("OLLAMA_PRELOAD_TIMEOUT_S", "120"))
+# Server-side chat sessions: prompt token budget, idle timeout and memory cap
+CHAT_TOKEN_BUDGET = int(os.getenv("CHAT_TOKEN_BUDGET", "1500"))
+CHAT_SESSION_IDLE_S = float(os.getenv("CHAT_SESSION_IDLE_S", "1800"))
+CHAT_SESSION_MAX = int(os.getenv("CHAT_SESSION_MAX", "10000"))
+CHAT_SESSION_MAX_MB = float(os.getenv("CHAT_SESSION_MAX_MB", "64"))
+# Answers to self-contained questions are reused for CHAT_CACHE_TTL_S (0 disables)
+CHAT_CACHE_TTL_S = float(os.getenv("CHAT_CACHE_TTL_S", "21600"))
+CHAT_CACHE_SIZE = int(os.getenv("CHAT_CACHE_SIZE", "2000"))
+CHAT_CACHE_MIN_SIMILARITY = float(os.getenv("CHAT_CACHE_MIN_SIMILARITY", "0.8"))
 
 # --- Global State ---
 predictor = None
+batch_scheduler = None
+prediction_cache = None
+near_duplicate_index = None
+model_version = "unknown"
 nutrition_service = None
+persistence_queue = None
+image_store = None
+history_cache = HistoryCache(ttl_seconds=HISTORY_CACHE_TTL)
+ollama_client = None
+chat_warmer = None
+gemini_model = None
+chat_metrics = ChatMetrics()
+chat_router = ChatRouter(
+    chat_metrics,
+    hedge_delay_s=CHAT_HEDGE_DELAY_S if CHAT_HEDGE_DELAY_S >= 0 else None,
+    first_token_deadline_s=CHAT_FIRST_TOKEN_DEADLINE_S or None
+)
+chat_sessions = ChatSessionStore(
+    token_budget=CHAT_TOKEN_BUDGET,
+    idle_ttl_s=CHAT_SESSION_IDLE_S,
+    max_sessions=CHAT_SESSION_MAX,
+    max_bytes=int(CHAT_SESSION_MAX_MB * 1024 * 1024)
+)
+chat_cache = ChatResponseCache(
+    ttl_seconds=CHAT_CACHE_TTL_S,
+    max_entries=CHAT_CACHE_SIZE,
+    min_similarity=CHAT_CACHE_MIN_SIMILARITY
+) if CHAT_CACHE_TTL_S > 0 else None
 db = None
 bucket = None
 
@@ -85,16 +196,18 @@ class ChatMessage(BaseModel):
 
 class ChatRequest(BaseModel):
     message: str
-    history: List[ChatMessage] = []
+    session_id: Optional[str] = None  # server-side history; omit to start a new session
+    history: List[ChatMessage] = []  # legacy clients: seeds a new session
 
 class ChatResponse(BaseModel):
     response: str
     status: str = "success"
+    session_id: Optional[str] = None
 
 # --- Startup Events ---
 @app.on_event("startup")
 async def startup_event():
-    global predictor, nutrition_service, db, bucket
+    global predictor, batch_scheduler, prediction_cache, near_duplicate_index, model_version, nutrition_service, persistence_queue, image_store, ollama_client, chat_warmer, gemini_model, db, bucket
     
     # 1. Initialize Firebase/Firestore
     try:
@@ -135,7 +248,6 @@ async def startup_event():
         except Exception as e:
             print(f"Failed to download model from GCS: {e}")
 
-<<<<<<< HEAD
     # Initialize Predictor with trained model
     predictor = None
     confidence_threshold = float(os.getenv("CONFIDENCE_THRESHOLD", "0.7"))
@@ -144,37 +256,125 @@ async def startup_event():
     trained_model_path = os.path.join("..", "ml", "models", "food_classifier.pth")
     if os.path.exists(trained_model_path):
         try:
-            predictor = FoodPredictor(trained_model_path, confidence_threshold=0.1)
+            predictor = FoodPredictor(trained_model_path, confidence_threshold=0.1, fast_decode=FAST_DECODE)
             print("Initialized with trained food classification model.")
         except Exception as e:
             print(f"Failed to load trained model: {e}")
     
     if predictor is None:
+        # Keras model if available, otherwise mock mode
         print("No trained model found. Please run training first.")
+        predictor = MockableFoodPredictor(
+            local_model_path if os.path.exists(local_model_path) else None,
+            fast_decode=FAST_DECODE
+        )
+
+    # Cache key component: a new model must never serve results from the old one
+    model_file = trained_model_path if isinstance(predictor, FoodPredictor) else local_model_path
+    if MODEL_VERSION:
+        model_version = MODEL_VERSION
+    elif os.path.exists(model_file):
+        model_version = f"{os.path.basename(model_file)}@{int(os.path.getmtime(model_file))}"
+    else:
+        model_version = "mock"
+    prediction_cache = PredictionCache(
+        max_entries=PREDICTION_CACHE_SIZE,
+        ttl_seconds=PREDICTION_CACHE_TTL,
+        disk_path=PREDICTION_CACHE_DB
+    )
+    if NEAR_DUP_MAX_DISTANCE >= 0:
+        near_duplicate_index = PerceptualIndex(capacity=NEAR_DUP_INDEX_SIZE, max_distance=NEAR_DUP_MAX_DISTANCE)
+
+    # Micro-batch concurrent /predict calls into one forward pass on a bounded worker pool
+    batch_scheduler = BatchScheduler(
+        predictor,
+        max_batch_size=BATCH_MAX_SIZE,
+        max_wait_ms=BATCH_MAX_WAIT_MS,
+        max_workers=INFERENCE_WORKERS,
+        max_queue=INFERENCE_QUEUE_MAX
+    )
+    await batch_scheduler.start()
+
+    # Content-addressed image storage: identical photos are stored once
+    if IMAGE_STORE == "local":
+        image_store = LocalImageStore(LOCAL_IMAGE_DIR, base_url=LOCAL_IMAGE_BASE_URL)
+    elif bucket:
+        image_store = GCSImageStore(bucket)
+
+    # Image uploads and Firestore history are written behind the response
+    persistence_queue = PersistenceQueue(
+        db,
+        image_store,
+        max_batch_size=PERSIST_BATCH_SIZE,
+        max_wait_ms=PERSIST_MAX_WAIT_MS,
+        upload_workers=PERSIST_UPLOAD_WORKERS,
+        max_retries=PERSIST_MAX_RETRIES,
+        max_queue=PERSIST_MAX_QUEUE,
+        submit_timeout_s=PERSIST_SUBMIT_TIMEOUT_S,
+        thumbnail_sizes={"thumbnail": THUMBNAIL_SIZE, "medium": MEDIUM_IMAGE_SIZE},
+        thumbnail_quality=THUMBNAIL_QUALITY,
+        on_commit=history_cache.invalidate
+    )
+    await persistence_queue.start()
 
-=======
-    # Initialize Predictor (Will default to mock if model missing)
-    predictor = FoodPredictor(local_model_path if os.path.exists(local_model_path) else None)
-    
->>>>>>> 9ce856a3b07268dd31a699b2dc2f080368e608f4
     # Initialize Nutrition Service
     nutrition_service = NutritionService()
+    if NUTRITION_WARMUP:
+        asyncio.create_task(warm_nutrition_cache())
+    # Chat clients (async, reused across requests; OLLAMA_HOST selects the server)
+    ollama_client = ollama.AsyncClient(timeout=OLLAMA_TIMEOUT_S)
+    if OLLAMA_PRELOAD:
+        # Pay the model load here rather than on the first user's chat
+        chat_warmer = ChatModelWarmer(
+            # Own client: a cold load can take longer than the per-chat OLLAMA_TIMEOUT_S
+            ollama.AsyncClient(timeout=OLLAMA_PRELOAD_TIMEOUT_S),
+            OLLAMA_MODEL,
+            keep_alive=OLLAMA_KEEP_ALIVE,
+            interval_s=OLLAMA_KEEP_WARM_S,
+            preload_timeout_s=OLLAMA_PRELOAD_TIMEOUT_S
+        )
+        await chat_warmer.start()
+        if chat_warmer.resident:
+            print(f"Chat model {OLLAMA_MODEL} loaded in {chat_warmer.last_load_ms:.0f}ms")
     print("Services initialized.")
-    if not GEMINI_API_KEY:
+    if GEMINI_API_KEY:
+        genai.configure(api_key=GEMINI_API_KEY)
+        gemini_model = genai.GenerativeModel(GEMINI_MODEL)
+    else:
         print("Warning: GEMINI_API_KEY not found. Chat features may be limited.")
 
-# --- Helper Functions ---
-def upload_to_gcs(file_obj, filename, content_type):
-    if not bucket:
-        return None
+def model_class_names():
+    classes = getattr(predictor, "classes", None) or getattr(predictor, "class_names", None) or []
+    if isinstance(classes, dict):  # class_indices.json: {"0": "chapati", ...}
+        classes = classes.values()
+    return [str(name).replace('_', ' ') for name in classes]
+
+async def warm_nutrition_cache():
+    names = model_class_names()
+    if not names:
+        return
     try:
-        blob = bucket.blob(filename)
-        blob.upload_from_file(file_obj, content_type=content_type)
-        return blob.public_url
+        started = time.time()
+        await run_in_threadpool(
+            nutrition_service.get_nutrition_info_many, names, max_concurrency=NUTRITION_WARMUP_CONCURRENCY
+        )
+        print(f"Nutrition cache warmed for {len(names)} classes in {time.time() - started:.1f}s")
     except Exception as e:
-        print(f"Upload failed: {e}")
-        return None
+        print(f"Nutrition warm-up failed: {e}")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if chat_warmer:
+        await chat_warmer.stop()
+    if batch_scheduler:
+        await batch_scheduler.stop()
+    if persistence_queue:
+        # Flush queued uploads and history records before exiting
+        await persistence_queue.stop()
+    if nutrition_service:
+        await nutrition_service.aclose()
 
+# --- Helper Functions ---
 # Simple Rate Limiter
 last_chat_request = {}
 
@@ -190,12 +390,160 @@ def check_rate_limit(ip: str):
 def health_check():
     return {
         "status": "running", 
-        "model_loaded": predictor.model is not None,
-        "mock_mode": predictor.mock_mode
+        "model_loaded": getattr(predictor, "model", None) is not None,
+        "mock_mode": getattr(predictor, "mock_mode", False),
+        "batching": batch_scheduler.stats() if batch_scheduler else None,
+        "prediction_cache": prediction_cache.stats() if prediction_cache else None,
+        "near_duplicates": near_duplicate_index.stats() if near_duplicate_index is not None else None,
+        "nutrition_cache": nutrition_service.cache.stats() if nutrition_service and nutrition_service.cache else None,
+        "nutrition_index": nutrition_service.index.stats() if nutrition_service else None,
+        "nutrition_single_flight": nutrition_service.single_flight.stats() if nutrition_service else None,
+        "persistence": persistence_queue.stats() if persistence_queue else None,
+        "image_store": image_store.stats() if image_store else None,
+        "history_cache": history_cache.stats(),
+        "chat": chat_metrics.stats(),
+        "chat_router": chat_router.stats(),
+        "chat_sessions": chat_sessions.stats(),
+        "chat_cache": chat_cache.stats() if chat_cache else None,
+        "chat_model": chat_warmer.stats() if chat_warmer else None
+    }
+
+@app.get("/ready")
+def readiness():
+    """
+    503 until the classifier is loaded and, with OLLAMA_PRELOAD, the chat model
+    is resident (or Gemini is configured to answer while it loads)
+    """
+    checks = {
+        "predictor": predictor is not None,
+        "chat_model": (chat_warmer.resident or gemini_model is not None) if chat_warmer else True,
     }
+    ready = all(checks.values())
+    return JSONResponse(status_code=200 if ready else 503, content={"ready": ready, "checks": checks})
+
+@app.get("/health/providers")
+def provider_health():
+    if not nutrition_service:
+        raise HTTPException(status_code=503, detail="System initializing...")
+    return {"providers": nutrition_service.provider_health()}
+
+async def resolve_nutrition_items(detected_items, size, is_unknown) -> List[NutritionInfo]:
+    """
+    Look up every detected item concurrently under one total deadline.
+    Items are returned in detection order; any lookup still running at the
+    deadline is abandoned in favour of the local table.
+    """
+    lookups = {}  # position -> task
+    for i, food_name in enumerate(detected_items):
+        if not (is_unknown or food_name == 'Unknown food'):
+            # Size-aware local index first, then the external nutrition APIs
+            lookups[i] = asyncio.create_task(nutrition_service.get_nutrition_info_async(
+                food_name,
+                size=size,
+                deadline=NUTRITION_DEADLINE_S,
+                hedge_delay=NUTRITION_HEDGE_DELAY_S
+            ))
+    if lookups:
+        _, late = await asyncio.wait(lookups.values(), timeout=NUTRITION_TOTAL_DEADLINE_S)
+        for task in late:
+            task.cancel()
+
+    items = []
+    for i, food_name in enumerate(detected_items):
+        if i not in lookups:
+            # Handle unknown food case
+            items.append(NutritionInfo(
+                food="Unknown food",
+                serving_size="N/A",
+                calories=0,
+                protein_g=0.0,
+                carbs_g=0.0,
+                fat_g=0.0,
+                source="Model prediction"
+            ))
+            continue
+
+        task = lookups[i]
+        if task.done() and not task.cancelled() and task.exception() is None:
+            nutrition_data = task.result()
+        else:
+            if task.done() and not task.cancelled():
+                print(f"Nutrition lookup failed for {food_name}: {task.exception()}")
+            nutrition_data = nutrition_service.local_nutrition(food_name, size)
+
+        items.append(NutritionInfo(
+            food=nutrition_data.get("food", food_name),
+            serving_size=str(nutrition_data.get("serving_size", "Unknown")),
+            calories=int(nutrition_data.get("calories", 0)),
+            protein_g=float(nutrition_data.get("protein_g", 0)),
+            carbs_g=float(nutrition_data.get("carbs_g", 0)),
+            fat_g=float(nutrition_data.get("fat_g", 0)),
+            source=nutrition_data.get("source", "Unknown")
+        ))
+    return items
+
+async def record_prediction(contents, content_type, items, total_calories, confidence, is_mock):
+    """
+    Response for this upload, with its own image and history record written in
+    the background. The content-addressed image name and the document id are
+    allocated locally, so the response already carries the final image_url and
+    prediction_id.
+    """
+    image_url = None
+    image_name = None
+    if image_store:
+        image_name = image_store.key(contents, content_type)
+        image_url = persistence_queue.image_url(image_name)
+
+    prediction_id = None
+    doc_ref = None
+    if db:
+        doc_ref = db.collection("predictions").document()
+        prediction_id = doc_ref.id
+
+    if image_store or db:
+        queued = await persistence_queue.submit(PersistJob(
+            doc_ref=doc_ref,
+            record={
+                "timestamp": firestore.SERVER_TIMESTAMP,
+                "image_url": image_url,
+                "detected_items": [item.dict() for item in items],
+                "total_calories": total_calories,
+                "confidence": confidence,
+                "is_mock": is_mock
+            },
+            image=contents if image_name else None,
+            image_name=image_name,
+            content_type=content_type
+        ))
+        if not queued:
+            # Storage is too far behind; nothing will exist at these references
+            image_url, prediction_id = None, None
+
+    return PredictionResponse(
+        status="success",
+        items=items,
+        total_calories=total_calories,
+        image_url=image_url,
+        prediction_id=prediction_id
+    )
+
+async def cached_prediction(contents, content_type, cached):
+    """
+    A new response for this upload from a cached prediction: only the items
+    are reused, never the earlier upload's image_url or prediction_id.
+    """
+    return await record_prediction(
+        contents,
+        content_type,
+        [NutritionInfo(**item) for item in cached["items"]],
+        cached["total_calories"],
+        cached.get("confidence", 0.0),
+        cached.get("is_mock", False)
+    )
 
 @app.post("/predict", response_model=PredictionResponse, responses={400: {"model": ErrorResponse}})
-async def predict_food(file: UploadFile = File(...)):
+async def predict_food(response: Response, file: UploadFile = File(...)):
     if not predictor:
         raise HTTPException(status_code=503, detail="System initializing...")
 
@@ -208,103 +556,82 @@ async def predict_food(file: UploadFile = File(...)):
         contents = await file.read()
         from io import BytesIO
         image_stream = BytesIO(contents)
+
+        # Identical uploads (retries, re-shares) reuse the stored prediction
+        cache_key = PredictionCache.make_key(contents, model_version) if prediction_cache else None
+        if cache_key:
+            cached = await run_in_threadpool(prediction_cache.get, cache_key)
+            if cached:
+                response.headers["X-Cache"] = "HIT"
+                return await cached_prediction(contents, file.content_type, cached)
+            response.headers["X-Cache"] = "MISS"
+
+        # Re-encoded / re-compressed / slightly cropped copies of an earlier upload
+        phash = None
+        if cache_key and near_duplicate_index is not None:
+            try:
+                phash = await run_in_threadpool(dhash, BytesIO(contents))
+            except Exception as e:
+                print(f"Perceptual hash failed: {e}")
+            match = near_duplicate_index.lookup(phash) if phash is not None else None
+            if match:
+                near_key, distance = match
+                cached = await run_in_threadpool(prediction_cache.get, near_key)
+                if cached:
+                    await run_in_threadpool(prediction_cache.set, cache_key, cached)
+                    response.headers["X-Cache"] = "NEAR-HIT"
+                    response.headers["X-Near-Duplicate-Distance"] = str(distance)
+                    return await cached_prediction(contents, file.content_type, cached)
         
-        prediction_result = predictor.predict(image_stream)
-<<<<<<< HEAD
-        food_class = prediction_result.get('class', 'unknown')
-        confidence = prediction_result.get('confidence', 0.0)
-        size = prediction_result.get('size', 'medium')
-        is_unknown = prediction_result.get('is_unknown', False)
-
-        # Process prediction result
-        response_items = []
-        total_calories = 0
-        
-        if is_unknown or food_class == 'Unknown food':
-            # Handle unknown food case
-            item = NutritionInfo(
-                food="Unknown food",
-                serving_size="N/A",
-                calories=0,
-                protein_g=0.0,
-                carbs_g=0.0,
-                fat_g=0.0,
-                source="Model prediction"
-            )
+        # Inference runs on the worker pool; the event loop stays free for other requests
+        queue_depth = batch_scheduler.depth() if batch_scheduler else 0
+        if batch_scheduler:
+            try:
+                prediction_result, queue_wait_ms = await batch_scheduler.submit(image_stream)
+            except QueueFullError as e:
+                raise HTTPException(
+                    status_code=503,
+                    detail="Server is busy analysing other photos. Please try again shortly.",
+                    headers={"Retry-After": "1", "X-Queue-Depth": str(e.depth)}
+                )
         else:
-            # Get nutrition data based on predicted food and size
-            nutrition_data = get_nutrition_data(food_class, size)
-            
-            item = NutritionInfo(
-                food=nutrition_data.get("food", food_class),
-                serving_size=nutrition_data.get("serving_size", "1 serving"),
-=======
+            queue_wait_ms = 0.0
+            prediction_result = await run_in_threadpool(predictor.predict, image_stream)
+        response.headers["X-Queue-Depth"] = str(queue_depth)
+        response.headers["X-Queue-Wait-Ms"] = f"{queue_wait_ms:.1f}"
+        timings = prediction_result.get("timings_ms")
+        if timings:
+            response.headers["Server-Timing"] = ", ".join(f"{stage};dur={ms}" for stage, ms in timings.items())
+
         detected_items = prediction_result.get("items", [prediction_result.get("class", "unknown")])
         confidence = prediction_result.get("confidence", 0.0)
+        size = prediction_result.get("size", "medium")
+        is_unknown = prediction_result.get("is_unknown", False)
 
         # Process each detected item
-        response_items = []
-        total_calories = 0
-        
-        for food_name in detected_items:
-            # Fetch Nutrition Info
-            nutrition_data = nutrition_service.get_nutrition_info(food_name)
-            
-            item = NutritionInfo(
-                food=nutrition_data.get("food", food_name),
-                serving_size=str(nutrition_data.get("serving_size", "Unknown")),
->>>>>>> 9ce856a3b07268dd31a699b2dc2f080368e608f4
-                calories=int(nutrition_data.get("calories", 0)),
-                protein_g=float(nutrition_data.get("protein_g", 0)),
-                carbs_g=float(nutrition_data.get("carbs_g", 0)),
-                fat_g=float(nutrition_data.get("fat_g", 0)),
-<<<<<<< HEAD
-                source=nutrition_data.get("source", "Database")
-            )
-        
-        response_items.append(item)
-        total_calories = item.calories
-=======
-                source=nutrition_data.get("source", "Unknown")
-            )
-            response_items.append(item)
-            total_calories += item.calories
->>>>>>> 9ce856a3b07268dd31a699b2dc2f080368e608f4
-
-        # Upload Image to GCS (Optional, for history)
-        image_url = None
-        if bucket:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"uploads/{timestamp}_{file.filename}"
-            image_stream.seek(0) # Reset stream
-            image_url = upload_to_gcs(image_stream, filename, file.content_type)
-
-        # Save to Firestore (History)
-        prediction_id = None
-        if db:
-            doc_ref = db.collection("predictions").document()
-            doc_ref.set({
-                "timestamp": firestore.SERVER_TIMESTAMP,
-                "image_url": image_url,
-                "detected_items": [item.dict() for item in response_items],
+        response_items = await resolve_nutrition_items(detected_items, size, is_unknown)
+        total_calories = sum(item.calories for item in response_items)
+
+        # Store the image and save to Firestore (History) in the background
+        is_mock = getattr(predictor, "mock_mode", False) or prediction_result.get("is_mock", False)
+        result = await record_prediction(contents, file.content_type, response_items, total_calories, confidence, is_mock)
+        # A mock / random-fallback label is never cached, or it would be served back as a HIT or NEAR-HIT
+        if cache_key and not is_mock:
+            # Only the prediction is cached; image_url and prediction_id belong to this upload
+            await run_in_threadpool(prediction_cache.set, cache_key, {
+                "items": [item.dict() for item in response_items],
                 "total_calories": total_calories,
                 "confidence": confidence,
-                "is_mock": predictor.mock_mode
+                "is_mock": is_mock
             })
-            prediction_id = doc_ref.id
-
-<<<<<<< HEAD
-        # Create standard response format (keep existing structure)
-=======
->>>>>>> 9ce856a3b07268dd31a699b2dc2f080368e608f4
-        return PredictionResponse(
-            status="success",
-            items=response_items,
-            total_calories=total_calories,
-            image_url=image_url,
-            prediction_id=prediction_id
-        )
-
+            if phash is not None:
+                near_duplicate_index.add(phash, cache_key)
+        return result
+
+    except HTTPException:
+        raise
+    except InvalidImageError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"Error processing request: {e}")
         # Return structured error even for 500
@@ -313,108 +640,188 @@ async def predict_food(file: UploadFile = File(...)):
 @app.get("/api/chat/test")
 async def test_ollama():
     try:
-        response = ollama.chat(
-            model="foodsnap-assistant",
-            messages=[{"role": "user", "content": "Hello"}]
+        response = await ollama_client.chat(
+            model=OLLAMA_MODEL,
+            messages=[{"role": "user", "content": "Hello"}],
+            keep_alive=OLLAMA_KEEP_ALIVE
         )
         return {"status": "success", "response": response}
     except Exception as e:
         return {"status": "error", "error": str(e)}
 
+def chat_session(request: ChatRequest):
+    """The request's server-side session; a new one is seeded from any client-sent history"""
+    session = chat_sessions.get_or_create(request.session_id)
+    if not session.turns and not session.summary:
+        seeded = False
+        for msg in request.history:
+            # Old clients start their history with the greeting; prompts must open with a user turn
+            seeded = seeded or msg.role == "user"
+            if seeded:
+                chat_sessions.append(session, msg.role, msg.content)
+    return session
+
+def cached_answer(session, message):
+    """Cached answer for a self-contained question, or None"""
+    if not chat_cache:
+        return None
+    return chat_cache.get(message, has_history=bool(session.turns or session.summary))
+
+def remember_answer(message, answer, has_history):
+    if chat_cache:
+        chat_cache.set(message, answer, has_history=has_history)
+
+def chat_backends(history, message):
+    """Streaming backends over the shared clients, local Ollama first; ChatRouter reorders by measured latency"""
+    messages = history + [{"role": "user", "content": message}]
+    backends = [("ollama", lambda: stream_ollama(
+        ollama_client, OLLAMA_MODEL, messages, {"temperature": 0.7}, keep_alive=OLLAMA_KEEP_ALIVE
+    ))]
+    if gemini_model:
+        backends.append(("gemini", lambda: stream_gemini(gemini_model, history, message)))
+    return backends
+
 @app.post("/api/chat", response_model=ChatResponse)
 async def chat_endpoint(request: ChatRequest, req: Request):
     # Rate Limit Check
     check_rate_limit(req.client.host)
 
     try:
-        # Try Ollama first
-        messages = []
-        for msg in request.history:
-            messages.append({
-                "role": msg.role,
-                "content": msg.content
-            })
-        
-        messages.append({
-            "role": "user",
-            "content": request.message
-        })
-
+        session = chat_session(request)
+        history = chat_sessions.messages(session)
+        cached = cached_answer(session, request.message)
+        if cached is not None:
+            chat_sessions.append(session, "user", request.message)
+            chat_sessions.append(session, "assistant", cached)
+            return ChatResponse(response=cached, status="success", session_id=session.id)
+
+        parts = []
+        status = "success"
         try:
-            response = ollama.chat(
-                model="foodsnap-assistant",
-                messages=messages,
-                options={
-                    "temperature": 0.7,
-                    "timeout": 30
-                }
-            )
-            
-            return ChatResponse(
-                response=response['message']['content'],
-                status="success"
-            )
-            
-        except Exception as ollama_error:
-            print(f"Ollama error: {ollama_error}")
-            
-            # Fallback to Gemini if available
-            if GEMINI_API_KEY:
-                try:
-                    model = genai.GenerativeModel('gemini-pro')
-                    chat_history = []
-                    for msg in request.history:
-                        chat_history.append({
-                            "role": msg.role,
-                            "parts": [msg.content]
-                        })
-
-                    chat = model.start_chat(history=chat_history)
-                    response = chat.send_message(request.message)
-                    
-                    return ChatResponse(
-                        response=response.text,
-                        status="success"
-                    )
-                except Exception as gemini_error:
-                    print(f"Gemini error: {gemini_error}")
-            
+            async for kind, value in chat_router.stream(chat_backends(history, request.message)):
+                if kind == "token":
+                    parts.append(value)
+                elif kind == "error":
+                    status = "error"
+        except ChatBackendError:
             # Final fallback
-            return ChatResponse(
-                response="I'm having trouble connecting to my knowledge base right now. Please try again in a moment, or feel free to upload a food photo for analysis!",
-                status="error"
-            )
-        
+            return ChatResponse(response=FALLBACK_MESSAGE, status="error", session_id=session.id)
+
+        answer = "".join(parts)
+        if status == "success":
+            remember_answer(request.message, answer, bool(history))
+        chat_sessions.append(session, "user", request.message)
+        chat_sessions.append(session, "assistant", answer)
+        return ChatResponse(response=answer, status=status, session_id=session.id)
     except Exception as e:
         print(f"Chat endpoint error: {e}")
         raise HTTPException(status_code=500, detail=f"Chat service error: {str(e)}")
 
+@app.post("/api/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest, req: Request):
+    """
+    Same as /api/chat, streamed as server-sent events: a "session" event
+    ({"session_id": ...}), "token" events ({"text": ...}) as the model
+    generates, then "done" ({"backend", "ttft_ms", "total_ms", "hedged"}) or "error"
+    ({"message": ...}). A cached answer arrives as a single token event with
+    backend "cache".
+    """
+    check_rate_limit(req.client.host)
+    started = time.perf_counter()
+    session = chat_session(request)
+    history = chat_sessions.messages(session)
+    cached = cached_answer(session, request.message)
+
+    async def events():
+        yield sse_event("session", {"session_id": session.id})
+        if cached is not None:
+            elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+            yield sse_event("token", {"text": cached})
+            yield sse_event("done", {"backend": "cache", "ttft_ms": elapsed_ms, "total_ms": elapsed_ms})
+            chat_sessions.append(session, "user", request.message)
+            chat_sessions.append(session, "assistant", cached)
+            return
+
+        parts = []
+        status = "success"
+        try:
+            async for kind, value in chat_router.stream(chat_backends(history, request.message)):
+                if kind == "token":
+                    parts.append(value)
+                    yield sse_event("token", {"text": value})
+                elif kind == "done":
+                    yield sse_event("done", value)
+                else:
+                    status = "error"
+                    yield sse_event("error", {"message": value})
+            answer = "".join(parts)
+            if status == "success":
+                remember_answer(request.message, answer, bool(history))
+            chat_sessions.append(session, "user", request.message)
+            chat_sessions.append(session, "assistant", answer)
+        except ChatBackendError:
+            yield sse_event("token", {"text": FALLBACK_MESSAGE})
+            yield sse_event("error", {"message": "No chat backend available"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/history")
-def get_history(limit: int = 10):
+def get_history(limit: int = 10, start_after: Optional[str] = None, fields: Optional[str] = None):
+    """
+    Newest predictions first. Pass the returned next_cursor as start_after for
+    the next page; fields is a comma-separated projection (e.g.
+    "detected_items,total_calories"), defaulting to what list views need.
+    """
     if not db:
         raise HTTPException(status_code=503, detail="Database not connected")
-    
+
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
     try:
-        docs = db.collection("predictions")\
-                 .order_by("timestamp", direction=firestore.Query.DESCENDING)\
-                 .limit(limit)\
-                 .stream()
-        
-        history = []
-        for doc in docs:
-            data = doc.to_dict()
-            if "timestamp" in data and data["timestamp"]:
-                data["timestamp"] = data["timestamp"].isoformat()
-            history.append(data)
-            
-        return {"history": history}
+        projection = parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        return history_cache.get_or_load(
+            (limit, start_after, tuple(projection)),
+            lambda: fetch_history_page(db, limit, start_after, projection)
+        )
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/history/export")
+def export_history(format: str = "ndjson", since: Optional[datetime] = None, until: Optional[datetime] = None,
+                   start_after: Optional[str] = None):
+    """
+    Whole meal log, oldest first, streamed as NDJSON or CSV with constant memory.
+    since/until bound the timestamp ([since, until)); every row carries a
+    cursor, so an interrupted download resumes with start_after=<last cursor>.
+    """
+    if not db:
+        raise HTTPException(status_code=503, detail="Database not connected")
+    if format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'csv'")
+    if start_after:
+        try:
+            decode_cursor(start_after)
+        except InvalidCursorError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    rows = iter_history(db, since=since, until=until, start_after=start_after)
+    if format == "csv":
+        return StreamingResponse(
+            export_csv(rows),
+            media_type="text/csv",
+            headers={"Content-Disposition": 'attachment; filename="foodsnap_history.csv"'}
+        )
+    return StreamingResponse(export_ndjson(rows), media_type="application/x-ndjson")
+
 if __name__ == "__main__":
     import uvicorn
-<<<<<<< HEAD
-    uvicorn.run(app, host="0.0.0.0", port=8081)
-=======
     uvicorn.run(app, host="0.0.0.0", port=8080)
->>>>>>> 9ce856a3b07268dd31a699b2dc2f080368e608f4
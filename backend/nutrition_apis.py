@@ -1,12 +1,35 @@
 import os
+import ssl
+import json
+import time
+import asyncio
 import requests
+import httpx
 import logging
-from typing import Optional, Dict, Any
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, List
+
+# Importable both as backend.nutrition_apis (API server) and nutrition_apis (ml/train_model.py)
+try:
+    from backend.nutrition_cache import NutritionCache, normalize_food_name
+    from backend.circuit_breaker import CircuitBreaker
+    from backend.nutrition_index import NutritionIndex, DEFAULT_DATA_PATH
+    from backend.single_flight import SingleFlight
+except ImportError:
+    from nutrition_cache import NutritionCache, normalize_food_name
+    from circuit_breaker import CircuitBreaker
+    from nutrition_index import NutritionIndex, DEFAULT_DATA_PATH
+    from single_flight import SingleFlight
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "nutrition_cache.sqlite3")
+PROVIDERS = ["Edamam", "USDA", "Spoonacular", "OpenFoodFacts"]
+
 class NutritionService:
-    def __init__(self):
+    def __init__(self, cache_path: Optional[str] = None, data_path: Optional[str] = None):
         # API Keys - Loaded from Environment Variables
         # Use the .env file to set these values!
         self.edamam_app_id = os.getenv("EDAMAM_APP_ID")
@@ -17,33 +40,266 @@ class NutritionService:
         # User Agent for Open Food Facts
         self.user_agent = "FoodSnap/1.0 (test@example.com)"
 
-    def get_nutrition_info(self, food_name: str) -> Dict[str, Any]:
+        # Provider endpoints (overridable, e.g. to point at local stub servers)
+        self.edamam_url = os.getenv("EDAMAM_API_URL", "https://api.edamam.com/api/food-database/v2/parser")
+        self.usda_url = os.getenv("USDA_API_URL", "https://api.nal.usda.gov/fdc/v1/foods/search")
+        self.spoonacular_url = os.getenv("SPOONACULAR_API_URL", "https://api.spoonacular.com/recipes/guessNutrition")
+        self.spoonacular_batch_url = os.getenv("SPOONACULAR_BATCH_API_URL", "https://api.spoonacular.com/recipes/parseIngredients")
+        self.open_food_facts_url = os.getenv("OPENFOODFACTS_API_URL", "https://world.openfoodfacts.org/cgi/search.pl")
+
+        # Connection pooling: one long-lived keep-alive session per provider so
+        # lookups skip DNS + TCP + TLS setup after the first request
+        self.pool_size = int(os.getenv("NUTRITION_POOL_SIZE", "10"))
+        self.keepalive_s = float(os.getenv("NUTRITION_KEEPALIVE_S", "30"))
+        self.retries = int(os.getenv("NUTRITION_RETRIES", "1"))
+        self.verify = os.getenv("NUTRITION_CA_BUNDLE") or True
+        self._sessions = {}
+        self._async_clients = {}  # created lazily inside the running event loop
+
+        # Latency budget per request, and a circuit breaker per provider so a
+        # degraded upstream is skipped instead of costing its full timeout every time
+        self.timeout = float(os.getenv("NUTRITION_PROVIDER_TIMEOUT_S", "5"))
+        self.breakers = {
+            name: CircuitBreaker(
+                name,
+                slow_call_s=float(os.getenv("NUTRITION_SLOW_CALL_S", "2.5")),
+                open_seconds=float(os.getenv("NUTRITION_BREAKER_OPEN_S", "30"))
+            )
+            for name in PROVIDERS
+        }
+
+        # Local table (nutrition_data.json) indexed once; resolves known foods without any network call
+        self.index = NutritionIndex({})
+        try:
+            self.index = NutritionIndex.load(data_path or os.getenv("NUTRITION_DATA_PATH", DEFAULT_DATA_PATH))
+        except Exception as e:
+            logger.error(f"Local nutrition table not loaded: {e}")
+
+        # Persistent lookup cache; NUTRITION_CACHE_DB="" disables it
+        cache_path = cache_path if cache_path is not None else os.getenv("NUTRITION_CACHE_DB", DEFAULT_CACHE_PATH)
+        self.cache = None
+        if cache_path:
+            try:
+                self.cache = NutritionCache(cache_path)
+            except Exception as e:
+                logger.error(f"Nutrition cache disabled: {e}")
+
+        # Concurrent misses for the same (normalized) food share one upstream lookup
+        self.single_flight = SingleFlight()
+
+    def get_nutrition_info(self, food_name: str, size: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Local table first (size-aware), then the cache; on a miss runs the provider
+        fallback chain and stores the result. "Not Found" is cached (with a short
+        TTL) only when every provider answered without a match; a lookup that hit a
+        timeout, an error or an open breaker is not cached, so a transient outage
+        does not turn into an hour of misses.
+        Concurrent misses for the same food wait for a single provider chain.
+        """
+        local = self.index.resolve(food_name, size)
+        if local:
+            return local
+
+        if self.cache:
+            cached = self.cache.get(food_name)
+            if cached is not None:
+                return cached
+
+        return self.single_flight.do(normalize_food_name(food_name), lambda: self._lookup(food_name))
+
+    def _lookup(self, food_name):
+        data, conclusive = self._fetch_from_providers(food_name)
+        if data is None:
+            data = self._default_fallback(food_name)
+        if self.cache and conclusive:
+            self.cache.set(food_name, data)
+        return data
+
+    def get_nutrition_info_many(self, food_names: List[str], max_concurrency: int = 8, batch_size: int = 20,
+                                output_path: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Bulk lookup for building class tables and warming the cache.
+
+        Names the local table or cache already know cost nothing. The rest go
+        through the same provider priority as get_nutrition_info, one provider
+        at a time: providers with a multi-item endpoint get one request per
+        `batch_size` names, the others are called for up to `max_concurrency`
+        names in parallel. With `output_path`, results are checkpointed there
+        as JSON ({food_name: data}) and names already in the file are skipped,
+        so an interrupted run resumes where it stopped.
+        """
+        results = {}
+        if output_path and os.path.exists(output_path):
+            try:
+                with open(output_path, "r") as f:
+                    results = json.load(f)
+                print(f"Resuming nutrition lookups: {len(results)} already in {output_path}")
+            except (OSError, ValueError) as e:
+                logger.error(f"Ignoring unreadable partial output {output_path}: {e}")
+
+        pending = []
+        inconclusive = set()  # names some provider failed to answer for
+        for name in dict.fromkeys(food_names):
+            if name in results:
+                continue
+            known = self.index.resolve(name) or (self.cache.get(name) if self.cache else None)
+            if known is not None:
+                results[name] = known
+            else:
+                pending.append(name)
+        self._write_checkpoint(output_path, results)
+
+        with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as pool:
+            for provider in self._enabled_providers():
+                if not pending:
+                    break
+                print(f"Fetching nutrition for {len(pending)} foods from {provider}...")
+                if provider in self._batch_providers():
+                    chunks = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+                    found = {}
+                    for chunk, (answered, chunk_found) in zip(
+                        chunks, pool.map(lambda chunk: self._call_batch(provider, chunk), chunks)
+                    ):
+                        found.update(chunk_found)
+                        if not answered:
+                            inconclusive.update(chunk)
+                else:
+                    found = {}
+                    for name, (answered, data) in zip(pending, pool.map(lambda name: self._call(provider, name), pending)):
+                        found[name] = data
+                        if not answered:
+                            inconclusive.add(name)
+
+                for name, data in found.items():
+                    if data:
+                        results[name] = data
+                        if self.cache:
+                            self.cache.set(name, data)
+                pending = [name for name in pending if name not in results]
+                self._write_checkpoint(output_path, results)
+
+        for name in pending:
+            results[name] = self._default_fallback(name)
+            if self.cache and name not in inconclusive:
+                self.cache.set(name, results[name])
+        self._write_checkpoint(output_path, results)
+        return {name: results[name] for name in food_names}
+
+    @staticmethod
+    def _write_checkpoint(output_path, results):
+        if not output_path:
+            return
+        tmp_path = f"{output_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(results, f, indent=2)
+        os.replace(tmp_path, output_path)  # never leave a half-written file behind
+
+    def _fetch_from_providers(self, food_name: str):
         """
-        Orchestrates the fallback logic: Edamam -> USDA -> Spoonacular -> Open Food Facts
+        Orchestrates the fallback logic: Edamam -> USDA -> Spoonacular -> Open Food Facts.
+        Returns (data or None, conclusive): conclusive is True when the data was
+        found or every provider answered that it has no match.
         """
         print(f"Fetching nutrition for: {food_name}")
         
-        # 1. Try Edamam
-        if self.edamam_app_id and self.edamam_app_key:
-            data = self._fetch_edamam(food_name)
-            if data: return data
-        
-        # 2. Try USDA
-        if self.usda_api_key:
-            data = self._fetch_usda(food_name)
-            if data: return data
-            
-        # 3. Try Spoonacular
-        if self.spoonacular_api_key:
-            data = self._fetch_spoonacular(food_name)
-            if data: return data
-            
-        # 4. Try Open Food Facts (No key required usually)
-        data = self._fetch_open_food_facts(food_name)
-        if data: return data
-        
-        # 5. Fallback if all fail
-        return self._default_fallback(food_name)
+        conclusive = True
+        for provider in self._enabled_providers():
+            answered, data = self._call(provider, food_name)
+            if data: return data, True
+            conclusive = conclusive and answered
+        return None, conclusive
+
+    async def get_nutrition_info_async(self, food_name: str, size: Optional[str] = None,
+                                       deadline: float = 6.0, hedge_delay: float = 0.5) -> Dict[str, Any]:
+        """
+        Async variant of get_nutrition_info for FastAPI handlers.
+
+        Providers are hedged instead of tried strictly in sequence: provider N starts
+        after N * hedge_delay seconds (or as soon as every higher-priority provider has
+        failed). The highest-priority good answer wins; once it is known, or when
+        `deadline` seconds have passed, outstanding calls are cancelled and the best
+        answer received so far (or the local fallback) is returned. Concurrent
+        misses for the same food (sync or async) share one fan-out.
+        """
+        local = self.index.resolve(food_name, size)
+        if local:
+            return local
+
+        if self.cache:
+            cached = self.cache.get(food_name)
+            if cached is not None:
+                return cached
+
+        return await self.single_flight.do_async(
+            normalize_food_name(food_name),
+            lambda: self._lookup_async(food_name, deadline, hedge_delay)
+        )
+
+    async def _lookup_async(self, food_name, deadline, hedge_delay):
+        data, conclusive = await self._fan_out(food_name, deadline, hedge_delay)
+        if data is None:
+            data = self._default_fallback(food_name)
+        if self.cache and conclusive:
+            self.cache.set(food_name, data)
+        return data
+
+    async def _fan_out(self, food_name, deadline, hedge_delay):
+        providers = self._enabled_providers()
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        end = start + deadline
+
+        pending = {}  # task -> provider index
+        results = {}  # provider index -> normalized data or None on failure
+        answered = {}  # provider index -> True if it gave a definite answer (match or no match)
+        cancel_state = {"deadline": False}  # tells cancelled calls why they were cancelled
+        launched = 0
+
+        def winner():
+            # Highest-priority good answer, but only once every provider above it has failed
+            for i in range(len(providers)):
+                if i not in results:
+                    return None
+                if results[i]:
+                    return results[i]
+            return None
+
+        try:
+            while True:
+                now = loop.time()
+                while launched < len(providers) and (
+                    now >= start + launched * hedge_delay
+                    or all(results.get(i) is None and i in results for i in range(launched))
+                ):
+                    task = asyncio.create_task(self._call_async(providers[launched], food_name, cancel_state))
+                    pending[task] = launched
+                    launched += 1
+
+                best = winner()
+                if best or len(results) == len(providers):
+                    break
+                if now >= end:
+                    cancel_state["deadline"] = True
+                    break
+
+                wake = end
+                if launched < len(providers):
+                    wake = min(wake, start + launched * hedge_delay)
+                done, _ = await asyncio.wait(pending, timeout=max(0.0, wake - now), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    index = pending.pop(task)
+                    answered[index], results[index] = (False, None) if task.exception() else task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+        if best:
+            return best, True
+        # Deadline passed: take the highest-priority answer that did arrive
+        for i in sorted(results):
+            if results[i]:
+                return results[i], True
+        return None, len(answered) == len(providers) and all(answered.values())
 
     def _normalize_response(self, food, calories, protein, carbs, fat, serving="1 serving", source="Estimated"):
         return {
@@ -56,184 +312,303 @@ class NutritionService:
             "source": source
         }
 
-    def _fetch_edamam(self, query):
-        try:
-            url = "https://api.edamam.com/api/food-database/v2/parser"
-            params = {
-                "app_id": self.edamam_app_id,
-                "app_key": self.edamam_app_key,
-                "ingr": query
-            }
-            response = requests.get(url, params=params, timeout=5)
-            if response.status_code == 200:
-                data = response.json()
-                if data.get("parsed"):
-                    item = data["parsed"][0]["food"]
-                    nutrients = item.get("nutrients", {})
-                    return self._normalize_response(
-                        food=item.get("label", query),
-                        calories=nutrients.get("ENERC_KCAL", 0),
-                        protein=nutrients.get("PROCNT", 0),
-                        carbs=nutrients.get("CHOCDF", 0),
-                        fat=nutrients.get("FAT", 0),
-                        serving="1 serving",
-                        source="Edamam"
-                    )
-                elif data.get("hints"):
-                    # Fallback to first hint
-                    item = data["hints"][0]["food"]
-                    nutrients = item.get("nutrients", {})
-                    return self._normalize_response(
-                        food=item.get("label", query),
-                        calories=nutrients.get("ENERC_KCAL", 0),
-                        protein=nutrients.get("PROCNT", 0),
-                        carbs=nutrients.get("CHOCDF", 0),
-                        fat=nutrients.get("FAT", 0),
-                        serving="1 serving",
-                        source="Edamam"
-                    )
-        except Exception as e:
-            logger.error(f"Edamam API error: {e}")
-        return None
+    # --- Providers ---
+    # Each provider is a request builder (url, params, headers) and a parser
+    # (JSON -> normalized dict or None), shared by the sync and async paths.
 
-    def _fetch_usda(self, query):
+    def _enabled_providers(self):
+        providers = []
+        if self.edamam_app_id and self.edamam_app_key:
+            providers.append("Edamam")
+        if self.usda_api_key:
+            providers.append("USDA")
+        if self.spoonacular_api_key:
+            providers.append("Spoonacular")
+        # Open Food Facts needs no key
+        providers.append("OpenFoodFacts")
+        return providers
+
+    def _provider_calls(self, provider):
+        return {
+            "Edamam": (self._edamam_request, self._parse_edamam),
+            "USDA": (self._usda_request, self._parse_usda),
+            "Spoonacular": (self._spoonacular_request, self._parse_spoonacular),
+            "OpenFoodFacts": (self._open_food_facts_request, self._parse_open_food_facts),
+        }[provider]
+
+    def _batch_providers(self):
+        # Providers with a multi-item endpoint: name -> (batch request builder, batch parser)
+        return {
+            "Spoonacular": (self._spoonacular_batch_request, self._parse_spoonacular_batch),
+        }
+
+    def provider_health(self) -> Dict[str, Any]:
+        enabled = self._enabled_providers()
+        return {
+            name: {"enabled": name in enabled, **breaker.stats()}
+            for name, breaker in self.breakers.items()
+        }
+
+    def _call(self, provider, query):
+        """(answered, normalized data or None); answered is False on errors, timeouts and open breakers"""
+        breaker = self.breakers[provider]
+        if not breaker.allow():
+            return False, None
+        build_request, parse = self._provider_calls(provider)
+        started = time.monotonic()
         try:
-            url = "https://api.nal.usda.gov/fdc/v1/foods/search"
-            params = {
-                "api_key": self.usda_api_key,
-                "query": query,
-                "pageSize": 1
-            }
-            response = requests.get(url, params=params, timeout=5)
-            if response.status_code == 200:
-                data = response.json()
-                if data.get("foods"):
-                    food = data["foods"][0]
-                    nutrients = food.get("foodNutrients", [])
-                    
-                    def get_nutrient(name_id):
-                        # Helper to find nutrient by id or name
-                        for n in nutrients:
-                            if n.get("nutrientName") == name_id or n.get("nutrientId") == name_id:
-                                return n.get("value", 0)
-                        return 0
-
-                    # USDA Nutrient IDs (standard) or names
-                    # Energy: 1008 (kcal), Protein: 1003, Fat: 1004, Carbs: 1005
-                    calories = next((n['value'] for n in nutrients if n['nutrientId'] == 1008), 0)
-                    protein = next((n['value'] for n in nutrients if n['nutrientId'] == 1003), 0)
-                    fat = next((n['value'] for n in nutrients if n['nutrientId'] == 1004), 0)
-                    carbs = next((n['value'] for n in nutrients if n['nutrientId'] == 1005), 0)
-                    
-                    return self._normalize_response(
-                        food=food.get("description", query),
-                        calories=calories,
-                        protein=protein,
-                        carbs=carbs,
-                        fat=fat,
-                        serving=food.get("servingSize", "100g"),
-                        source="USDA"
-                    )
+            url, params, headers = build_request(query)
+            response = self._get_session(provider).get(
+                url, params=params, headers=headers, timeout=self.timeout, verify=self.verify
+            )
+            # A 200 without a match still means the provider is healthy
+            ok = response.status_code == 200
+            data = parse(response.json(), query) if ok else None
         except Exception as e:
-            logger.error(f"USDA API error: {e}")
-        return None
+            ok, data = False, None
+            logger.error(f"{provider} API error: {e}")
+        breaker.record(ok, time.monotonic() - started)
+        return ok, data
 
-    def _fetch_spoonacular(self, query):
+    def _call_batch(self, provider, queries):
+        """(answered, {query: normalized data}) from one multi-item request"""
+        breaker = self.breakers[provider]
+        if not breaker.allow():
+            return False, {}
+        build_request, parse = self._batch_providers()[provider]
+        started = time.monotonic()
         try:
-            # Using Quick Answer Endpoint or Search
-            url = "https://api.spoonacular.com/recipes/guessNutrition"
-            params = {
-                "apiKey": self.spoonacular_api_key,
-                "title": query
-            }
-            response = requests.get(url, params=params, timeout=5)
-            if response.status_code == 200:
-                data = response.json()
-                # Returns calories, carbs, fat, protein dicts with value and unit
-                return self._normalize_response(
-                    food=query,
-                    calories=data.get("calories", {}).get("value"),
-                    protein=data.get("protein", {}).get("value"),
-                    carbs=data.get("carbs", {}).get("value"),
-                    fat=data.get("fat", {}).get("value"),
-                    serving="1 serving",
-                    source="Spoonacular"
-                )
+            url, params, headers, body = build_request(queries)
+            response = self._get_session(provider).post(
+                url, params=params, headers=headers, data=body, timeout=self.timeout, verify=self.verify
+            )
+            ok = response.status_code == 200
+            found = parse(response.json(), queries) if ok else {}
         except Exception as e:
-            logger.error(f"Spoonacular API error: {e}")
-        return None
+            ok, found = False, {}
+            logger.error(f"{provider} batch API error: {e}")
+        breaker.record(ok, time.monotonic() - started)
+        return ok, found
 
-    def _fetch_open_food_facts(self, query):
+    async def _call_async(self, provider, query, cancel_state=None):
+        breaker = self.breakers[provider]
+        if not breaker.allow():
+            return False, None
+        build_request, parse = self._provider_calls(provider)
+        started = time.monotonic()
         try:
-            url = "https://world.openfoodfacts.org/cgi/search.pl"
-            params = {
-                "search_terms": query,
-                "search_simple": 1,
-                "action": "process",
-                "json": 1,
-                "page_size": 1
-            }
-            headers = {"User-Agent": self.user_agent}
-            response = requests.get(url, params=params, headers=headers, timeout=5)
-            if response.status_code == 200:
-                data = response.json()
-                if data.get("products"):
-                    product = data["products"][0]
-                    nutriments = product.get("nutriments", {})
-                    
-                    return self._normalize_response(
-                        food=product.get("product_name", query),
-                        calories=nutriments.get("energy-kcal_100g", 0),
-                        protein=nutriments.get("proteins_100g", 0),
-                        carbs=nutriments.get("carbohydrates_100g", 0),
-                        fat=nutriments.get("fat_100g", 0),
-                        serving="100g",
-                        source="OpenFoodFacts"
-                    )
+            url, params, headers = build_request(query)
+            response = await self._get_async_client(provider).get(url, params=params, headers=headers)
+            ok = response.status_code == 200
+            data = parse(response.json(), query) if ok else None
+        except asyncio.CancelledError:
+            elapsed = time.monotonic() - started
+            if (cancel_state and cancel_state["deadline"]) or elapsed > breaker.slow_call_s:
+                # Still hanging when the lookup gave up: count it as a slow, bad call
+                breaker.record(False, elapsed)
+            else:
+                # Lost the hedge race; says nothing about provider health
+                breaker.release()
+            raise
         except Exception as e:
-            logger.error(f"OpenFoodFacts API error: {e}")
-        return None
+            ok, data = False, None
+            logger.error(f"{provider} API error: {e}")
+        breaker.record(ok, time.monotonic() - started)
+        return ok, data
 
-    def _default_fallback(self, query):
-        # Fallback for the 5 MVP items to ensure a good demo experience
-        # if the external APIs fail or are not configured.
-        query_lower = query.lower().replace("_", " ")
-        
-        defaults = {
-            "apple pie": {
-                "calories": 296, "protein": 2.4, "carbs": 43.5, "fat": 13.1, 
-                "serving": "1 slice (100g)"
-            },
-            "baby back ribs": {
-                "calories": 280, "protein": 20.0, "carbs": 8.0, "fat": 18.0, 
-                "serving": "100g"
-            },
-            "baklava": {
-                "calories": 420, "protein": 6.0, "carbs": 50.0, "fat": 22.0, 
-                "serving": "1 piece (100g)"
-            },
-            "beef carpaccio": {
-                "calories": 160, "protein": 24.0, "carbs": 0.5, "fat": 7.0, 
-                "serving": "100g"
-            },
-            "beef tartare": {
-                "calories": 250, "protein": 18.0, "carbs": 2.0, "fat": 19.0, 
-                "serving": "100g"
-            }
+    def _get_session(self, provider):
+        session = self._sessions.get(provider)
+        if session is None:
+            retry = Retry(
+                total=self.retries,
+                backoff_factor=0.2,
+                status_forcelist=(502, 503, 504),
+                allowed_methods=frozenset(["GET"])
+            )
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=retry)
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.verify = self.verify
+            session = self._sessions.setdefault(provider, session)
+        return session
+
+    def _get_async_client(self, provider):
+        client = self._async_clients.get(provider)
+        if client is None:
+            verify = self.verify
+            if isinstance(verify, str):
+                verify = ssl.create_default_context(cafile=verify)
+            limits = httpx.Limits(
+                max_connections=self.pool_size,
+                max_keepalive_connections=self.pool_size,
+                keepalive_expiry=self.keepalive_s
+            )
+            # Transport-level retries cover connect errors only; status retries
+            # would fight the hedging deadline
+            transport = httpx.AsyncHTTPTransport(retries=self.retries, limits=limits, verify=verify)
+            client = httpx.AsyncClient(timeout=self.timeout, transport=transport)
+            self._async_clients[provider] = client
+        return client
+
+    def close(self):
+        for session in self._sessions.values():
+            session.close()
+        self._sessions.clear()
+
+    async def aclose(self):
+        for client in self._async_clients.values():
+            await client.aclose()
+        self._async_clients.clear()
+        self.close()
+
+    def _edamam_request(self, query):
+        params = {
+            "app_id": self.edamam_app_id,
+            "app_key": self.edamam_app_key,
+            "ingr": query
         }
-        
-        for key in defaults:
-            if key in query_lower:
-                d = defaults[key]
-                return {
-                    "food": query,
-                    "serving_size": d["serving"],
-                    "calories": d["calories"],
-                    "protein_g": d["protein"],
-                    "carbs_g": d["carbs"],
-                    "fat_g": d["fat"],
-                    "source": "Fallback (MVP)"
-                }
+        return self.edamam_url, params, None
+
+    def _parse_edamam(self, data, query):
+        if data.get("parsed"):
+            item = data["parsed"][0]["food"]
+        elif data.get("hints"):
+            # Fallback to first hint
+            item = data["hints"][0]["food"]
+        else:
+            return None
+        nutrients = item.get("nutrients", {})
+        return self._normalize_response(
+            food=item.get("label", query),
+            calories=nutrients.get("ENERC_KCAL", 0),
+            protein=nutrients.get("PROCNT", 0),
+            carbs=nutrients.get("CHOCDF", 0),
+            fat=nutrients.get("FAT", 0),
+            serving="1 serving",
+            source="Edamam"
+        )
+
+    def _usda_request(self, query):
+        params = {
+            "api_key": self.usda_api_key,
+            "query": query,
+            "pageSize": 1
+        }
+        return self.usda_url, params, None
+
+    def _parse_usda(self, data, query):
+        if not data.get("foods"):
+            return None
+        food = data["foods"][0]
+        nutrients = food.get("foodNutrients", [])
+
+        # USDA Nutrient IDs (standard)
+        # Energy: 1008 (kcal), Protein: 1003, Fat: 1004, Carbs: 1005
+        calories = next((n['value'] for n in nutrients if n['nutrientId'] == 1008), 0)
+        protein = next((n['value'] for n in nutrients if n['nutrientId'] == 1003), 0)
+        fat = next((n['value'] for n in nutrients if n['nutrientId'] == 1004), 0)
+        carbs = next((n['value'] for n in nutrients if n['nutrientId'] == 1005), 0)
+
+        return self._normalize_response(
+            food=food.get("description", query),
+            calories=calories,
+            protein=protein,
+            carbs=carbs,
+            fat=fat,
+            serving=food.get("servingSize", "100g"),
+            source="USDA"
+        )
+
+    def _spoonacular_request(self, query):
+        # Using Quick Answer Endpoint or Search
+        params = {
+            "apiKey": self.spoonacular_api_key,
+            "title": query
+        }
+        return self.spoonacular_url, params, None
+
+    def _parse_spoonacular(self, data, query):
+        # Returns calories, carbs, fat, protein dicts with value and unit
+        return self._normalize_response(
+            food=query,
+            calories=data.get("calories", {}).get("value"),
+            protein=data.get("protein", {}).get("value"),
+            carbs=data.get("carbs", {}).get("value"),
+            fat=data.get("fat", {}).get("value"),
+            serving="1 serving",
+            source="Spoonacular"
+        )
+
+    def _spoonacular_batch_request(self, queries):
+        # parseIngredients takes one ingredient per line and returns per-line nutrition
+        params = {"apiKey": self.spoonacular_api_key}
+        body = {
+            "ingredientList": "\n".join(queries),
+            "servings": 1,
+            "includeNutrition": "true"
+        }
+        return self.spoonacular_batch_url, params, None, body
+
+    def _parse_spoonacular_batch(self, data, queries):
+        if not isinstance(data, list) or len(data) != len(queries):
+            return {}
+        found = {}
+        for query, item in zip(queries, data):
+            nutrients = {n.get("name"): n.get("amount") for n in item.get("nutrition", {}).get("nutrients", [])}
+            if "Calories" not in nutrients:
+                found[query] = None
+                continue
+            amount = item.get("amount")
+            unit = item.get("unitShort") or item.get("unit") or ""
+            found[query] = self._normalize_response(
+                food=item.get("name", query),
+                calories=nutrients.get("Calories"),
+                protein=nutrients.get("Protein"),
+                carbs=nutrients.get("Carbohydrates"),
+                fat=nutrients.get("Fat"),
+                serving=f"{amount:g} {unit}".strip() if isinstance(amount, (int, float)) else "1 serving",
+                source="Spoonacular"
+            )
+        return found
+
+    def _open_food_facts_request(self, query):
+        params = {
+            "search_terms": query,
+            "search_simple": 1,
+            "action": "process",
+            "json": 1,
+            "page_size": 1
+        }
+        headers = {"User-Agent": self.user_agent}
+        return self.open_food_facts_url, params, headers
+
+    def _parse_open_food_facts(self, data, query):
+        if not data.get("products"):
+            return None
+        product = data["products"][0]
+        nutriments = product.get("nutriments", {})
+
+        return self._normalize_response(
+            food=product.get("product_name", query),
+            calories=nutriments.get("energy-kcal_100g", 0),
+            protein=nutriments.get("proteins_100g", 0),
+            carbs=nutriments.get("carbohydrates_100g", 0),
+            fat=nutriments.get("fat_100g", 0),
+            serving="100g",
+            source="OpenFoodFacts"
+        )
+
+    def local_nutrition(self, food_name: str, size: Optional[str] = None) -> Dict[str, Any]:
+        """Best local answer without any network call (e.g. when a lookup misses its deadline)"""
+        return self._default_fallback(food_name, size)
+
+    def _default_fallback(self, query, size=None):
+        # Looser local match (e.g. the MVP demo items) if the external APIs
+        # fail or are not configured.
+        local = self.index.resolve(query, size, min_score=0.45, partial=True)
+        if local:
+            return local
 
         # Generic fallback
         return {
@@ -0,0 +1,99 @@
+"""
+Persistent SQLite cache for NutritionService lookups.
+
+Results are keyed on the normalized food name and kept for a per-source TTL.
+"Not Found" and local-fallback results are cached too (negative caching) with a
+much shorter TTL, so a food that no provider knows does not pay every
+provider's timeout on each request. NutritionService only stores them when
+every provider actually answered; timeouts and open breakers are not cached.
+"""
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+DAY = 24 * 3600
+
+# Seconds a result from each source stays fresh
+DEFAULT_TTLS = {
+    "Edamam": 30 * DAY,
+    "USDA": 30 * DAY,
+    "Spoonacular": 7 * DAY,
+    "OpenFoodFacts": 7 * DAY,
+    "Fallback (MVP)": 3600,
+    "Not Found": 3600,
+}
+DEFAULT_TTL = DAY
+
+
+def normalize_food_name(name: str) -> str:
+    """'Paneer_Butter  Masala ' -> 'paneer butter masala'"""
+    return re.sub(r"\s+", " ", name.replace("_", " ")).strip().lower()
+
+
+class NutritionCache:
+    def __init__(self, path: str, ttls: Optional[Dict[str, float]] = None):
+        self.path = path
+        self.ttls = dict(DEFAULT_TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS nutrition ("
+            "name TEXT PRIMARY KEY, source TEXT NOT NULL, data TEXT NOT NULL, expires REAL NOT NULL)"
+        )
+        self._db.commit()
+
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+
+    def get(self, food_name: str) -> Optional[Dict[str, Any]]:
+        key = normalize_food_name(food_name)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT source, data, expires FROM nutrition WHERE name = ?", (key,)
+            ).fetchone()
+            if row is None or row[2] <= time.time():
+                self.misses += 1
+                return None
+            if self.is_negative(row[0]):
+                self.negative_hits += 1
+            else:
+                self.hits += 1
+            return json.loads(row[1])
+
+    def set(self, food_name: str, data: Dict[str, Any]):
+        key = normalize_food_name(food_name)
+        source = data.get("source", "Unknown")
+        expires = time.time() + self.ttls.get(source, DEFAULT_TTL)
+        with self._lock:
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO nutrition (name, source, data, expires) VALUES (?, ?, ?, ?)",
+                    (key, source, json.dumps(data), expires)
+                )
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.error(f"Nutrition cache write failed: {e}")
+
+    @staticmethod
+    def is_negative(source: str) -> bool:
+        return source in ("Not Found", "Fallback (MVP)")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            (entries,) = self._db.execute("SELECT COUNT(*) FROM nutrition").fetchone()
+            return {
+                "entries": entries,
+                "hits": self.hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+            }
@@ -0,0 +1,180 @@
+"""
+Offline nutrition index built once from the local table (nutrition_data.json).
+
+Names resolve in three steps, all in memory:
+
+1. exact key ("paneer_butter_masala")
+2. normalized key or display name ("Paneer Butter Masala" -> "paneer butter masala")
+3. fuzzy: candidates come from an inverted trigram index, and every word of the
+   name must pair with a word of the entry that differs only by spelling
+   (word-level character-trigram Dice: "chapatti" vs "chapati", "pizzas" vs
+   "pizza"). An extra, missing or different word ("sushi rice" vs "sushi",
+   "paneer tikka masala" vs "paneer butter masala", "beef taco" vs "beef
+   tartare") is a different food and never matches, so it goes to the
+   providers instead of getting confidently wrong macros.
+
+``partial=True`` is the loose last-resort estimate used once the providers
+have missed: whole-name trigram Dice, with a boost when one name's words are a
+subset of the other's ("homemade apple pie", "dal" vs "dal tadka").
+
+Entries may carry per-size values under "sizes" (small / medium / large).
+"""
+import json
+import os
+import re
+import threading
+from collections import defaultdict
+from typing import Any, Dict, Optional
+
+try:
+    from backend.nutrition_cache import normalize_food_name
+except ImportError:
+    from nutrition_cache import normalize_food_name
+
+DEFAULT_DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "nutrition_data.json")
+
+# Partial matches: score given when every word of the query is in the entry name, or vice versa
+TOKEN_SUBSET_SCORE = 0.8
+# Lowest word-level similarity that still counts as a spelling variant
+MIN_WORD_SIMILARITY = 0.7
+
+
+def _clean(name: str) -> str:
+    return re.sub(r"[^a-z0-9 ]", "", normalize_food_name(name))
+
+
+def _trigrams(text: str):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _stem(word: str) -> str:
+    """Light plural stemming for word alignment: 'ribs' -> 'rib', 'tomatoes' -> 'tomato'"""
+    if len(word) > 4 and word.endswith("oes"):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def _dice(grams, other_grams) -> float:
+    return 2 * len(grams & other_grams) / (len(grams) + len(other_grams))
+
+
+def _spelling_match(words, other_words) -> Optional[float]:
+    """Lowest word similarity if the words pair one-to-one with spelling variants in other_words, else None"""
+    if len(words) != len(other_words):
+        return None
+    remaining = list(other_words)
+    lowest = 1.0
+    for word in words:
+        grams = _trigrams(word)
+        score, other = max((_dice(grams, _trigrams(other)), other) for other in remaining)
+        if score < MIN_WORD_SIMILARITY:
+            return None
+        remaining.remove(other)
+        lowest = min(lowest, score)
+    return lowest
+
+
+class NutritionIndex:
+    def __init__(self, table: Dict[str, Dict[str, Any]]):
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._normalized: Dict[str, str] = {}
+        self._trigrams: Dict[str, set] = {}
+        self._tokens: Dict[str, set] = {}
+        self._postings = defaultdict(set)  # trigram -> entry keys
+        self._lock = threading.Lock()
+
+        for key, entry in table.items():
+            self._entries[key] = entry
+            names = {_clean(key), _clean(entry.get("display_name", key))}
+            for name in names:
+                self._normalized.setdefault(name, key)
+            name = _clean(key)
+            self._trigrams[key] = _trigrams(name)
+            self._tokens[key] = [_stem(word) for word in name.split()]
+            for gram in self._trigrams[key]:
+                self._postings[gram].add(key)
+
+        self.exact_hits = 0
+        self.normalized_hits = 0
+        self.fuzzy_hits = 0
+        self.misses = 0
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_DATA_PATH) -> "NutritionIndex":
+        with open(path, "r") as f:
+            return cls(json.load(f))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def resolve(self, food_name: str, size: Optional[str] = None, min_score: float = 0.6,
+                partial: bool = False) -> Optional[Dict[str, Any]]:
+        """Local nutrition for food_name (optionally a specific size), or None if nothing is close enough"""
+        key = self.match(food_name, min_score, partial)
+        if key is None:
+            return None
+        entry = self._entries[key]
+        values = entry.get("sizes", {}).get(size, entry)
+        return {
+            "food": entry.get("display_name", key),
+            "serving_size": values.get("serving_size", "1 serving"),
+            "calories": int(values.get("calories", 0)),
+            "protein_g": float(values.get("protein_g", 0)),
+            "carbs_g": float(values.get("carbs_g", 0)),
+            "fat_g": float(values.get("fat_g", 0)),
+            "source": entry.get("source", "Database")
+        }
+
+    def match(self, food_name: str, min_score: float = 0.6, partial: bool = False) -> Optional[str]:
+        """Key of the best matching entry, or None; partial also accepts names sharing only some words"""
+        if food_name in self._entries:
+            self._count("exact_hits")
+            return food_name
+
+        name = _clean(food_name)
+        if name in self._normalized:
+            self._count("normalized_hits")
+            return self._normalized[name]
+
+        query_grams = _trigrams(name)
+        query_tokens = [_stem(word) for word in name.split()]
+        candidates = set()
+        for gram in query_grams:
+            candidates.update(self._postings.get(gram, ()))
+
+        best_key, best_score = None, 0.0
+        for key in candidates:
+            tokens = self._tokens[key]
+            if partial:
+                score = _dice(query_grams, self._trigrams[key])
+                if query_tokens and (set(query_tokens) <= set(tokens) or set(tokens) <= set(query_tokens)):
+                    score = max(score, TOKEN_SUBSET_SCORE)
+            else:
+                score = _spelling_match(query_tokens, tokens)
+                if score is None:
+                    continue  # an extra, missing or different word: "beef taco" is not beef tartare
+            if score > best_score or (score == best_score and best_key is not None and key < best_key):
+                best_key, best_score = key, score
+
+        if best_key is not None and best_score >= min_score:
+            self._count("fuzzy_hits")
+            return best_key
+        self._count("misses")
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "exact_hits": self.exact_hits,
+                "normalized_hits": self.normalized_hits,
+                "fuzzy_hits": self.fuzzy_hits,
+                "misses": self.misses,
+            }
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
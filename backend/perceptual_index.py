@@ -0,0 +1,116 @@
+"""
+Perceptual-hash index for near-duplicate uploads.
+
+The mobile client often re-encodes, re-compresses or slightly crops the same
+plate photo, which defeats the byte-level PredictionCache. A 64-bit dHash of
+the downscaled image survives those edits, so uploads whose hash is within
+``max_distance`` bits (Hamming distance) of a previous one can reuse that
+prediction.
+
+Lookups use multi-index hashing: the 64 bits are split into max_distance + 1
+bands and, by the pigeonhole principle, any hash within max_distance bits
+matches at least one band exactly. Each band is a flat NumPy array, so a
+lookup is a handful of vectorised equality scans plus an exact popcount on the
+few candidates. Memory is fixed by ``capacity`` (oldest entries are
+overwritten first).
+"""
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ml.image_decode import open_image
+
+HASH_BITS = 64
+_POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def dhash(image_path_or_file, hash_size: int = 8) -> int:
+    """Difference hash: compare horizontally adjacent pixels of a tiny grayscale thumbnail"""
+    image = open_image(image_path_or_file, draft_size=(hash_size * 8, hash_size * 8))
+    small = np.asarray(image.convert("L").resize((hash_size + 1, hash_size)), dtype=np.int16)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return value
+
+
+def _popcount(values: np.ndarray) -> np.ndarray:
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values)
+    return _POPCOUNT8[values.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+class PerceptualIndex:
+    def __init__(self, capacity: int = 100000, max_distance: int = 4):
+        self.capacity = max(1, int(capacity))
+        self.max_distance = max(0, min(int(max_distance), HASH_BITS - 1))
+
+        # Band layout: max_distance + 1 contiguous bit ranges covering all 64 bits
+        n_bands = self.max_distance + 1
+        widths = [HASH_BITS // n_bands + (1 if i < HASH_BITS % n_bands else 0) for i in range(n_bands)]
+        self._bands: List[Tuple[int, int]] = []
+        shift = 0
+        for width in widths:
+            self._bands.append((shift, (1 << width) - 1))
+            shift += width
+        band_dtype = np.uint16 if max(widths) <= 16 else np.uint32 if max(widths) <= 32 else np.uint64
+
+        self._hashes = np.zeros(self.capacity, dtype=np.uint64)
+        self._band_values = [np.zeros(self.capacity, dtype=band_dtype) for _ in self._bands]
+        self._values: List[Any] = [None] * self.capacity
+        self._size = 0
+        self._next = 0
+        self._lock = threading.Lock()
+
+        self.lookups = 0
+        self.matches = 0
+
+    def __len__(self):
+        return self._size
+
+    def add(self, phash: int, value: Any):
+        with self._lock:
+            slot = self._next
+            self._hashes[slot] = phash
+            for (shift, mask), band in zip(self._bands, self._band_values):
+                band[slot] = (phash >> shift) & mask
+            self._values[slot] = value
+            self._next = (slot + 1) % self.capacity
+            self._size = min(self._size + 1, self.capacity)
+
+    def lookup(self, phash: int) -> Optional[Tuple[Any, int]]:
+        """Return (value, distance) of the closest stored hash within max_distance, else None"""
+        with self._lock:
+            self.lookups += 1
+            if self._size == 0:
+                return None
+
+            candidates = []
+            for (shift, mask), band in zip(self._bands, self._band_values):
+                hits = np.flatnonzero(band[:self._size] == ((phash >> shift) & mask))
+                if hits.size:
+                    candidates.append(hits)
+            if not candidates:
+                return None
+
+            slots = np.unique(np.concatenate(candidates))
+            distances = _popcount(self._hashes[slots] ^ np.uint64(phash))
+            best = int(np.argmin(distances))
+            distance = int(distances[best])
+            if distance > self.max_distance:
+                return None
+            self.matches += 1
+            return self._values[int(slots[best])], distance
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": self._size,
+                "capacity": self.capacity,
+                "max_distance": self.max_distance,
+                "lookups": self.lookups,
+                "matches": self.matches,
+                "array_bytes": self._hashes.nbytes + sum(b.nbytes for b in self._band_values),
+            }
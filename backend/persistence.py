@@ -0,0 +1,241 @@
+"""
+Write-behind persistence for /predict history.
+
+The handler pre-allocates the Firestore document (its id is generated client
+side) and the image's content-addressed name in the ImageStore, answers the user, and hands the writes to this
+queue. A background worker drains the queue in batches: the batch's images are
+uploaded concurrently on a small thread pool, then every history record in the
+batch is written with one Firestore batched commit. When thumbnail sizes are
+configured, WebP derivatives are generated and stored alongside each image
+and their URLs added to the record (``thumbnail_url``, ``medium_url``). Failed uploads and commits
+are retried with exponential backoff; ``stop()`` flushes everything still
+queued before the process exits.
+
+Every job holds its upload's bytes, so the queue is bounded at ``max_queue``
+jobs. When storage falls behind and the queue is full, ``submit()`` waits up
+to ``submit_timeout_s`` for space (slowing /predict down instead of growing
+memory) and then drops the job, counting it in ``dropped``.
+"""
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    from backend.thumbnails import make_thumbnails
+except ImportError:
+    from thumbnails import make_thumbnails
+
+logger = logging.getLogger(__name__)
+
+# Firestore rejects batched writes with more than 500 operations
+FIRESTORE_BATCH_LIMIT = 500
+
+
+@dataclass
+class PersistJob:
+    doc_ref: Any  # pre-allocated Firestore DocumentReference, or None without Firestore
+    record: Dict[str, Any]
+    image: Optional[bytes] = None
+    image_name: Optional[str] = None  # ImageStore key
+    content_type: Optional[str] = None
+
+
+class PersistenceQueue:
+    def __init__(self, db, store, max_batch_size: int = 50, max_wait_ms: float = 200.0,
+                 upload_workers: int = 4, max_retries: int = 3, backoff_s: float = 0.5,
+                 thumbnail_sizes: Optional[Dict[str, int]] = None, thumbnail_quality: int = 80,
+                 on_commit: Optional[Callable[[], None]] = None, max_queue: int = 200,
+                 submit_timeout_s: float = 2.0):
+        self.db = db
+        self.store = store  # backend.image_store.ImageStore, or None
+        self.max_batch_size = max(1, min(int(max_batch_size), FIRESTORE_BATCH_LIMIT))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.upload_workers = max(1, int(upload_workers))
+        self.max_retries = max(0, int(max_retries))
+        self.backoff_s = backoff_s
+        self.thumbnail_sizes = {label: size for label, size in (thumbnail_sizes or {}).items() if size > 0}
+        self.thumbnail_quality = thumbnail_quality
+        self.on_commit = on_commit  # called after each successful Firestore commit (e.g. cache invalidation)
+        self.max_queue = max(1, int(max_queue))
+        self.submit_timeout_s = submit_timeout_s
+
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._stopping = False
+
+        # Counters for health reporting
+        self.jobs_written = 0
+        self.batches_committed = 0
+        self.uploads = 0
+        self.retries = 0
+        self.failed_uploads = 0
+        self.failed_records = 0
+        self.thumbnails_generated = 0
+        self.failed_thumbnails = 0
+        self.dropped = 0
+
+    def image_url(self, image_name: str) -> Optional[str]:
+        """URL the image will have once stored (no network call)"""
+        return self.store.url(image_name) if self.store else None
+
+    async def start(self):
+        if self._worker is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.upload_workers, thread_name_prefix="persist")
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flush everything still queued, then shut down"""
+        if self._worker is None or self._stopping:
+            return
+        # The worker drains the queue up to this marker, then exits
+        self._stopping = True
+        await self._queue.put(None)
+        await self._worker
+        self._worker = None
+        self._stopping = False
+        self._executor.shutdown(wait=True)
+        self._executor = None
+
+    async def submit(self, job: PersistJob) -> bool:
+        """Queue a job, waiting up to submit_timeout_s for space; False if it was dropped"""
+        if self._worker is None or self._stopping:
+            raise RuntimeError("Persistence queue is not running")
+        try:
+            await asyncio.wait_for(self._queue.put(job), self.submit_timeout_s)
+        except asyncio.TimeoutError:
+            self.dropped += 1
+            logger.error(f"Persistence queue full ({self.max_queue} jobs), dropping {job.image_name or 'record'}")
+            return False
+        return True
+
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self.depth(),
+            "max_queue": self.max_queue,
+            "dropped": self.dropped,
+            "jobs_written": self.jobs_written,
+            "batches_committed": self.batches_committed,
+            "avg_batch_size": round(self.jobs_written / self.batches_committed, 2) if self.batches_committed else 0.0,
+            "uploads": self.uploads,
+            "retries": self.retries,
+            "failed_uploads": self.failed_uploads,
+            "failed_records": self.failed_records,
+            "thumbnails_generated": self.thumbnails_generated,
+            "failed_thumbnails": self.failed_thumbnails,
+        }
+
+    async def _collect(self) -> Tuple[List[PersistJob], bool]:
+        """(batch, stop marker reached)"""
+        loop = asyncio.get_running_loop()
+        batch = []
+        job = await self._queue.get()
+        deadline = loop.time() + self.max_wait
+        while job is not None:
+            batch.append(job)
+            if len(batch) >= self.max_batch_size:
+                return batch, False
+            if not self._queue.empty():
+                job = self._queue.get_nowait()
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                return batch, False
+            try:
+                job = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                return batch, False
+        return batch, True
+
+    async def _run(self):
+        while True:
+            batch, stop = await self._collect()
+            if batch:
+                await self._write(batch)
+            if stop:
+                return
+
+    async def _write(self, batch: List[PersistJob]):
+        loop = asyncio.get_running_loop()
+        try:
+            uploads = [job for job in batch if job.image is not None and job.image_name and self.store]
+            done = await asyncio.gather(*[
+                loop.run_in_executor(self._executor, self._with_retries, "upload", self._upload, job)
+                for job in uploads
+            ])
+            for job, ok in zip(uploads, done):
+                if ok:
+                    self.uploads += 1
+                else:
+                    self.failed_uploads += 1
+                    job.record["image_url"] = None  # never point history at a missing image
+
+            if self.thumbnail_sizes:
+                # One set of derivatives per distinct image in the batch
+                stored = {job.image_name: job for job, ok in zip(uploads, done) if ok}
+                urls = await asyncio.gather(*[
+                    loop.run_in_executor(self._executor, self._store_thumbnails, job) for job in stored.values()
+                ])
+                urls = dict(zip(stored, urls))
+                for job, ok in zip(uploads, done):
+                    if ok:
+                        job.record.update(urls[job.image_name])
+
+            records = [job for job in batch if job.doc_ref is not None]
+            if records and self.db:
+                ok = await loop.run_in_executor(self._executor, self._with_retries, "commit", self._commit, records)
+                if ok:
+                    self.batches_committed += 1
+                    self.jobs_written += len(records)
+                    if self.on_commit:
+                        self.on_commit()
+                else:
+                    self.failed_records += len(records)
+        except Exception as e:
+            logger.error(f"Persistence batch failed: {e}")
+
+    def _with_retries(self, what, fn, arg) -> bool:
+        for attempt in range(self.max_retries + 1):
+            try:
+                fn(arg)
+                return True
+            except Exception as e:
+                if attempt == self.max_retries:
+                    logger.error(f"Persistence {what} failed after {attempt + 1} attempts: {e}")
+                    return False
+                self.retries += 1
+                time.sleep(self.backoff_s * (2 ** attempt))
+
+    def _upload(self, job: PersistJob):
+        # No-op when the same content is already stored
+        self.store.put(job.image_name, job.image, job.content_type)
+
+    def _store_thumbnails(self, job: PersistJob) -> Dict[str, str]:
+        """Generate missing derivatives; returns their record fields ({"thumbnail_url": ...})"""
+        names = {label: self.store.derivative_key(job.image_name, label) for label in self.thumbnail_sizes}
+        missing = {label: self.thumbnail_sizes[label] for label, name in names.items() if not self.store.has(name)}
+        if missing:
+            try:
+                derivatives = make_thumbnails(job.image, missing, self.thumbnail_quality)
+            except Exception as e:
+                self.failed_thumbnails += 1
+                logger.error(f"Thumbnail generation failed for {job.image_name}: {e}")
+                return {}
+            for label, data in derivatives.items():
+                if not self._with_retries("upload", lambda d: self.store.put(names[label], d, "image/webp"), data):
+                    names.pop(label)
+            self.thumbnails_generated += len(derivatives)
+        return {f"{label}_url": self.store.url(name) for label, name in names.items()}
+
+    def _commit(self, jobs: List[PersistJob]):
+        batch = self.db.batch()
+        for job in jobs:
+            batch.set(job.doc_ref, job.record)
+        batch.commit()
@@ -0,0 +1,135 @@
+"""
+Content-addressed cache for /predict results.
+
+Entries are keyed by a SHA-256 of the uploaded bytes plus the model version, so
+re-uploads of the same photo (retries, double-taps, re-shares) skip inference,
+nutrition lookups and persistence entirely. There are two tiers:
+
+- an in-memory LRU with a TTL and a maximum entry count
+- an optional SQLite file that survives restarts (also TTL- and size-bounded)
+"""
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class PredictionCache:
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 86400,
+                 disk_path: Optional[str] = None, max_disk_entries: int = 100000):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = float(ttl_seconds)
+        self.max_disk_entries = max(1, int(max_disk_entries))
+
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._db = None
+        if disk_path:
+            try:
+                self._db = sqlite3.connect(disk_path, check_same_thread=False)
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS predictions ("
+                    "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL, stored REAL NOT NULL)"
+                )
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.error(f"Prediction cache disk tier disabled: {e}")
+                self._db = None
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(contents: bytes, model_version: str) -> str:
+        digest = hashlib.sha256()
+        digest.update(model_version.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(contents)
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires > now:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return value
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, expires FROM predictions WHERE key = ?", (key,)
+                ).fetchone()
+                if row and row[1] > now:
+                    value = json.loads(row[0])
+                    self._remember(key, value, row[1])
+                    self.disk_hits += 1
+                    return value
+                if row:
+                    self._db.execute("DELETE FROM predictions WHERE key = ?", (key,))
+                    self._db.commit()
+
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value: Dict[str, Any]):
+        now = time.time()
+        expires = now + self.ttl
+        with self._lock:
+            self._remember(key, value, expires)
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO predictions (key, value, expires, stored) VALUES (?, ?, ?, ?)",
+                        (key, json.dumps(value), expires, now)
+                    )
+                    self._prune_disk(now)
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    logger.error(f"Prediction cache write failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_entries": len(self._memory),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "disk_enabled": self._db is not None,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round((self.memory_hits + self.disk_hits) / lookups, 3) if lookups else 0.0,
+            }
+
+    def _remember(self, key, value, expires):
+        # Caller holds the lock
+        self._memory[key] = (value, expires)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def _prune_disk(self, now):
+        # Caller holds the lock
+        self._db.execute("DELETE FROM predictions WHERE expires <= ?", (now,))
+        (count,) = self._db.execute("SELECT COUNT(*) FROM predictions").fetchone()
+        if count > self.max_disk_entries:
+            self._db.execute(
+                "DELETE FROM predictions WHERE key IN "
+                "(SELECT key FROM predictions ORDER BY stored ASC LIMIT ?)",
+                (count - self.max_disk_entries,)
+            )
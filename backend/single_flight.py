@@ -0,0 +1,85 @@
+"""
+Single-flight request coalescing.
+
+Concurrent callers asking for the same key share one in-flight call: the first
+caller (the leader) runs it, everyone arriving before it finishes (followers)
+waits for the same result. Works across threads (sync callers) and the event
+loop (async callers) because the shared slot is a concurrent.futures.Future.
+Nothing is cached once the call completes; that is the caller's job.
+"""
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict
+
+
+class SingleFlight:
+    def __init__(self):
+        self._in_flight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+        self.leaders = 0
+        self.followers = 0
+
+    def _join(self, key):
+        """(future, is_leader) for key"""
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.followers += 1
+                return future, False
+            future = Future()
+            self._in_flight[key] = future
+            self.leaders += 1
+            return future, True
+
+    def _finish(self, key, future, result=None, error=None):
+        with self._lock:
+            self._in_flight.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        future, leader = self._join(key)
+        if not leader:
+            return future.result()
+        try:
+            result = fn()
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result)
+        return result
+
+    async def do_async(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        future, leader = self._join(key)
+        if leader:
+            # Run the call as its own task so a cancelled leader (e.g. client
+            # disconnect) does not take the followers' result down with it
+            task = asyncio.create_task(fn())
+
+            def done(t):
+                if t.cancelled():
+                    self._finish(key, future, error=asyncio.CancelledError())
+                elif t.exception() is not None:
+                    self._finish(key, future, error=t.exception())
+                else:
+                    self._finish(key, future, t.result())
+
+            task.add_done_callback(done)
+        shared = asyncio.wrap_future(future)
+        # Mark the outcome retrieved even if this caller gives up waiting first
+        shared.add_done_callback(lambda f: f.cancelled() or f.exception())
+        return await asyncio.shield(shared)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.leaders + self.followers
+            return {
+                "in_flight": len(self._in_flight),
+                "upstream_calls": self.leaders,
+                "coalesced": self.followers,
+                "coalescing_ratio": round(self.followers / total, 3) if total else 0.0,
+            }
@@ -0,0 +1,49 @@
+"""
+ChatResponseCache keys and spelling-variant matching.
+
+Run with:
+    python -m pytest backend/test_chat_cache.py
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from backend.chat_cache import ChatResponseCache, canonical_question
+
+
+@pytest.mark.parametrize("cached, asked", [
+    ("can I eat chapati with ghee", "can I eat chapati with no ghee"),
+    ("is rice better than roti", "is roti better than rice"),
+    ("3 chapatis and 2 bowls of dal", "2 chapatis and 3 bowls of dal"),
+    ("how many calories in 2 chapatis", "how many calories in 3 chapatis"),
+    ("is dal healthy", "is dal unhealthy"),
+    ("calories in paneer butter masala", "calories in butter masala"),
+])
+def test_different_questions_are_not_served(cached, asked):
+    assert canonical_question(cached) != canonical_question(asked)
+    cache = ChatResponseCache()
+    cache.set(cached, "cached answer")
+    assert cache.get(asked) is None
+    cache.set(asked, "other answer")
+    assert cache.get(cached) == "cached answer"
+
+
+@pytest.mark.parametrize("cached, asked", [
+    ("How many calories in 2 Chapatis?", "how many calories are there in 2 chapatis"),
+    ("calories in 2 chapatis", "calories in 2 chapattis"),
+    ("can I eat chapati with no ghee", "can i eat chapatti with no ghee"),
+])
+def test_rephrased_and_misspelled_questions_are_served(cached, asked):
+    cache = ChatResponseCache()
+    cache.set(cached, "cached answer")
+    assert cache.get(asked) == "cached answer"
+
+
+def test_follow_up_bypasses_cache_when_session_has_history():
+    cache = ChatResponseCache()
+    cache.set("is it healthy", "cached answer")
+    assert cache.get("is it healthy", has_history=True) is None
+    assert cache.stats()["bypassed"] == 1
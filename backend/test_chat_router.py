@@ -0,0 +1,126 @@
+"""
+ChatRouter against stub backends (plain async generators, no Ollama or Gemini).
+
+Run with:
+    python -m pytest backend/test_chat_router.py
+"""
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from backend.chat_router import ChatRouter
+from backend.chat_stream import ChatBackendError, ChatMetrics
+
+
+class StubBackend:
+    """Answers after `delay` seconds, or fails before its first token while `failing`"""
+
+    def __init__(self, name, delay=0.0, failing=False):
+        self.name, self.delay, self.failing = name, delay, failing
+        self.calls = 0
+
+    def __call__(self):
+        return self._stream()
+
+    async def _stream(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.failing:
+            raise RuntimeError(f"{self.name} is down")
+        for token in ("hello", " there"):
+            yield token
+
+    @property
+    def backend(self):
+        return self.name, self
+
+
+async def ask(router, *stubs):
+    """(answering backend, whether it was hedged); raises ChatBackendError like the router"""
+    async for kind, value in router.stream([stub.backend for stub in stubs]):
+        if kind == "done":
+            return value["backend"], value["hedged"]
+        if kind == "error":
+            raise RuntimeError(value)
+
+
+def test_slow_backend_is_hedged_and_measured():
+    async def run():
+        router = ChatRouter(ChatMetrics(), hedge_delay_s=0.05)
+        ollama, gemini = StubBackend("ollama", delay=0.5), StubBackend("gemini", delay=0.01)
+        started = time.perf_counter()
+        assert await ask(router, ollama, gemini) == ("gemini", True)
+        assert time.perf_counter() - started < 0.4
+        # The cancelled loser counts as slow, so the fast backend goes first next time
+        assert [name for name, _ in router.order([ollama.backend, gemini.backend])] == ["gemini", "ollama"]
+    asyncio.run(run())
+
+
+def test_failure_hands_over_at_once_and_deadline_raises():
+    async def run():
+        router = ChatRouter(ChatMetrics(), hedge_delay_s=1.0, first_token_deadline_s=0.2)
+        started = time.perf_counter()
+        assert await ask(router, StubBackend("ollama", failing=True), StubBackend("gemini")) == ("gemini", False)
+        assert time.perf_counter() - started < 0.5
+
+        with pytest.raises(ChatBackendError):
+            await ask(router, StubBackend("ollama", delay=1.0), StubBackend("gemini", delay=1.0))
+        assert router.stats()["deadline_misses"] == 1
+    asyncio.run(run())
+
+
+def test_single_error_does_not_demote():
+    async def run():
+        router = ChatRouter(ChatMetrics(), hedge_delay_s=0.5)
+        ollama, gemini = StubBackend("ollama", failing=True), StubBackend("gemini", delay=0.01)
+        assert await ask(router, ollama, gemini) == ("gemini", False)
+
+        ollama.failing = False
+        assert await ask(router, ollama, gemini) == ("ollama", False)
+        assert ollama.calls == 2
+    asyncio.run(run())
+
+
+def test_demoted_backend_is_probed_in_the_background_and_recovers():
+    async def run():
+        router = ChatRouter(ChatMetrics(), hedge_delay_s=0.5, probe_interval_s=0.05, outcome_max_age_s=0.3)
+        ollama, gemini = StubBackend("ollama", failing=True), StubBackend("gemini", delay=0.01)
+        for _ in range(router.min_outcomes):
+            await ask(router, ollama, gemini)
+        assert router.demoted("ollama")
+
+        # Demoted: users get gemini while ollama is probed on the side, at most once per interval
+        ollama.failing = False
+        await asyncio.sleep(0.06)
+        calls = ollama.calls
+        assert await ask(router, ollama, gemini) == ("gemini", False)
+        assert await ask(router, ollama, gemini) == ("gemini", False)
+        await asyncio.sleep(0.01)
+        assert ollama.calls == calls + 1
+        assert router.stats()["probes"] == 1
+
+        # Successful probes and aged-out failures bring it back
+        for _ in range(10):
+            await asyncio.sleep(0.06)
+            await ask(router, ollama, gemini)
+            if not router.demoted("ollama"):
+                break
+        assert await ask(router, ollama, gemini) == ("ollama", False)
+    asyncio.run(run())
+
+
+def test_healthy_backends_are_not_probed():
+    async def run():
+        router = ChatRouter(ChatMetrics(), hedge_delay_s=0.5, probe_interval_s=0.01)
+        ollama, gemini = StubBackend("ollama", delay=0.01), StubBackend("gemini", delay=0.01)
+        for _ in range(5):
+            assert await ask(router, ollama, gemini) == ("ollama", False)
+            await asyncio.sleep(0.02)
+        assert gemini.calls == 0
+        assert router.stats()["probes"] == 0
+    asyncio.run(run())
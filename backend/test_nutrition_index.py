@@ -0,0 +1,65 @@
+"""
+NutritionIndex matching against the shipped nutrition_data.json.
+
+Run with:
+    python -m pytest backend/test_nutrition_index.py
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from backend.nutrition_apis import NutritionService
+from backend.nutrition_index import NutritionIndex
+
+
+@pytest.fixture(scope="module")
+def index():
+    return NutritionIndex.load()
+
+
+@pytest.mark.parametrize("name, key", [
+    ("chapati", "chapati"),
+    ("Paneer Butter Masala", "paneer_butter_masala"),
+    ("Chapatti", "chapati"),
+    ("chapatis", "chapati"),
+    ("pizzas", "pizza"),
+    ("paneer buter masala", "paneer_butter_masala"),
+    ("beef tartar", "beef tartare"),
+    ("baby back rib", "baby back ribs"),
+    ("apple pies", "apple pie"),
+])
+def test_spelling_variants_match(index, name, key):
+    assert index.match(name) == key
+
+
+@pytest.mark.parametrize("name", [
+    "beef tacos",
+    "beef taco",
+    "paneer tikka masala",
+    "paneer masala",
+    "sushi rice",
+    "apple",
+])
+def test_different_words_do_not_match(index, name):
+    assert index.match(name) is None
+
+
+def test_partial_match_is_still_available_as_last_resort(index):
+    assert index.match("paneer tikka masala", min_score=0.45, partial=True) == "paneer_butter_masala"
+    assert index.match("apple", min_score=0.45, partial=True) == "apple pie"
+
+
+def test_near_miss_food_goes_to_providers(monkeypatch):
+    service = NutritionService(cache_path="")
+    asked = []
+
+    def providers(food_name):
+        asked.append(food_name)
+        return {"food": "Beef Taco", "calories": 170, "source": "USDA"}, True
+
+    monkeypatch.setattr(service, "_fetch_from_providers", providers)
+    assert service.get_nutrition_info("beef tacos")["source"] == "USDA"
+    assert asked == ["beef tacos"]
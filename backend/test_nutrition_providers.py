@@ -0,0 +1,158 @@
+"""
+NutritionService against local stub provider servers (no API keys, no network).
+
+Run with:
+    python -m pytest backend/test_nutrition_providers.py
+"""
+import asyncio
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from backend.nutrition_apis import NutritionService
+
+EDAMAM_MATCH = {"parsed": [{"food": {"label": "Stub Edamam", "nutrients": {"ENERC_KCAL": 210, "PROCNT": 7}}}]}
+USDA_MATCH = {"foods": [{"description": "Stub USDA", "servingSize": "100g", "foodNutrients": [
+    {"nutrientId": 1008, "value": 116},
+    {"nutrientId": 1003, "value": 9},
+]}]}
+NO_PRODUCTS = {"products": []}
+
+
+class StubProvider:
+    """HTTP server answering every GET with `body` after `delay` seconds; counts requests"""
+
+    def __init__(self, body=None, status=200, delay=0.0):
+        self.body, self.status, self.delay = body or {}, status, delay
+        self.hits = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                stub.hits += 1
+                time.sleep(stub.delay)
+                payload = json.dumps(stub.body).encode()
+                try:
+                    self.send_response(stub.status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                except OSError:
+                    pass  # the client gave up (hedge cancelled or timed out)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/"
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stubs(monkeypatch):
+    created = []
+
+    def make(edamam, usda, off=None):
+        off = off or StubProvider(NO_PRODUCTS)
+        created.extend([edamam, usda, off])
+        monkeypatch.setenv("EDAMAM_APP_ID", "stub")
+        monkeypatch.setenv("EDAMAM_APP_KEY", "stub")
+        monkeypatch.setenv("USDA_API_KEY", "stub")
+        monkeypatch.delenv("SPOONACULAR_API_KEY", raising=False)
+        monkeypatch.setenv("EDAMAM_API_URL", edamam.url)
+        monkeypatch.setenv("USDA_API_URL", usda.url)
+        monkeypatch.setenv("OPENFOODFACTS_API_URL", off.url)
+        monkeypatch.setenv("NUTRITION_RETRIES", "0")
+        monkeypatch.setenv("NUTRITION_PROVIDER_TIMEOUT_S", "2")
+        return NutritionService(cache_path="")
+
+    yield make
+    for stub in created:
+        stub.close()
+
+
+def test_hedged_fan_out_returns_lower_priority_answer_at_deadline(stubs):
+    edamam = StubProvider(EDAMAM_MATCH, delay=1.5)
+    service = stubs(edamam, StubProvider(USDA_MATCH))
+
+    async def lookup():
+        started = time.perf_counter()
+        data = await service.get_nutrition_info_async("stub hedge food", deadline=0.4, hedge_delay=0.05)
+        elapsed = time.perf_counter() - started
+        await service.aclose()
+        return data, elapsed
+
+    data, elapsed = asyncio.run(lookup())
+    assert data["source"] == "USDA"
+    assert elapsed < 1.0  # did not wait for the hanging higher-priority provider
+    # Edamam was still hanging at the deadline: that counts against it
+    assert service.breakers["Edamam"].stats()["error_rate"] == 1.0
+
+
+def test_hedged_fan_out_skips_failed_provider_without_waiting(stubs):
+    service = stubs(StubProvider(status=500), StubProvider(USDA_MATCH))
+
+    async def lookup():
+        started = time.perf_counter()
+        data = await service.get_nutrition_info_async("stub failover food", deadline=3.0, hedge_delay=1.0)
+        elapsed = time.perf_counter() - started
+        await service.aclose()
+        return data, elapsed
+
+    data, elapsed = asyncio.run(lookup())
+    assert data["source"] == "USDA"
+    assert elapsed < 0.8  # USDA started as soon as Edamam failed, not after the hedge delay
+
+
+def test_breaker_opens_and_stops_calling_failing_provider(stubs):
+    edamam = StubProvider(status=500)
+    service = stubs(edamam, StubProvider(USDA_MATCH))
+    breaker = service.breakers["Edamam"]
+
+    for i in range(breaker.min_calls):
+        assert service.get_nutrition_info(f"stub breaker food {i}")["source"] == "USDA"
+    assert breaker.state == "open"
+    calls = edamam.hits
+
+    assert service.get_nutrition_info("stub breaker food after")["source"] == "USDA"
+    assert edamam.hits == calls
+    assert breaker.stats()["skipped"] == 1
+    service.close()
+
+
+def test_single_flight_coalesces_concurrent_lookups(stubs):
+    usda = StubProvider(USDA_MATCH, delay=0.3)
+    service = stubs(StubProvider({}), usda)
+
+    async def lookup_many():
+        results = await asyncio.gather(*[
+            service.get_nutrition_info_async("stub shared food", deadline=2.0, hedge_delay=1.0) for _ in range(5)
+        ])
+        await service.aclose()
+        return results
+
+    results = asyncio.run(lookup_many())
+    assert all(data["source"] == "USDA" for data in results)
+    assert usda.hits == 1
+
+    with ThreadPoolExecutor(max_workers=5) as pool:
+        results = list(pool.map(service.get_nutrition_info, ["stub other food"] * 5))
+    assert all(data["source"] == "USDA" for data in results)
+    assert usda.hits == 2
+    service.close()
@@ -0,0 +1,35 @@
+"""
+WebP derivatives of uploaded photos for history views.
+
+Clients listing history only need a small preview, not the multi-megabyte
+original. Derivatives are generated by the persistence worker (never on the
+request path): JPEGs are decoded at a reduced DCT scale close to the largest
+requested size, EXIF rotation is applied, and each size is encoded as WebP.
+"""
+import io
+from typing import Dict
+
+from PIL import Image, ImageOps
+
+
+def make_thumbnails(data: bytes, sizes: Dict[str, int], quality: int = 80) -> Dict[str, bytes]:
+    """{label: WebP bytes} with the longest side of each at most sizes[label] pixels"""
+    if not sizes:
+        return {}
+    largest = max(sizes.values())
+    image = Image.open(io.BytesIO(data))
+    if image.format == "JPEG":
+        image.draft("RGB", (largest, largest))
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGB")
+
+    derivatives = {}
+    # Largest first, each smaller size resampled from the previous one
+    for label, size in sorted(sizes.items(), key=lambda item: -item[1]):
+        image = image.copy()
+        image.thumbnail((size, size), Image.LANCZOS)
+        out = io.BytesIO()
+        image.save(out, format="WEBP", quality=quality, method=4)
+        derivatives[label] = out.getvalue()
+    return derivatives
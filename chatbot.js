@@ -2,12 +2,10 @@ class ChatbotWidget {
     constructor() {
         this.isOpen = false;
         this.conversationHistory = [];
+        this.sessionId = null; // the server keeps the conversation; we only send new messages
         this.isTyping = false;
-<<<<<<< HEAD
-        this.API_URL = "http://127.0.0.1:8081/api/chat"; // ✅ Backend URL
-=======
         this.API_URL = "http://127.0.0.1:8080/api/chat"; // ✅ Backend URL
->>>>>>> 9ce856a3b07268dd31a699b2dc2f080368e608f4
+        this.STREAM_URL = `${this.API_URL}/stream`; // Server-sent events, tokens as they are generated
         this.init();
     }
 
@@ -116,14 +114,14 @@ class ChatbotWidget {
         this.showTyping();
 
         try {
-            console.log("Sending to:", this.API_URL);
+            console.log("Sending to:", this.STREAM_URL);
 
-            const response = await fetch(this.API_URL, {
+            const response = await fetch(this.STREAM_URL, {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify({
                     message: message,
-                    history: this.conversationHistory
+                    session_id: this.sessionId
                 })
             });
 
@@ -133,10 +131,7 @@ class ChatbotWidget {
                 throw new Error(`Server error ${response.status}`);
             }
 
-            const data = await response.json();
-
-            this.hideTyping();
-            this.addMessage(data.response || "No response from assistant.", 'assistant');
+            await this.readStream(response);
 
         } catch (error) {
             console.error('Chat error:', error);
@@ -145,20 +140,96 @@ class ChatbotWidget {
         }
     }
 
-    addMessage(content, role) {
+    async readStream(response) {
+        // Render "token" events into one assistant bubble as they arrive
+        let buffer = '';
+        let messageDiv = null;
+        let text = '';
+
+        const feed = (chunk) => {
+            buffer += chunk;
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const { event, data } = this.parseEvent(buffer.slice(0, boundary));
+                buffer = buffer.slice(boundary + 2);
+
+                if (event === 'session') {
+                    this.sessionId = data.session_id;
+                } else if (event === 'token') {
+                    if (!messageDiv) {
+                        // First token: swap the dots for the answer, keep input locked until done
+                        document.getElementById('typing-indicator').style.display = 'none';
+                        messageDiv = this.createMessageElement('assistant');
+                    }
+                    text += data.text;
+                    messageDiv.textContent = text;
+                    this.scrollToBottom();
+                } else if (event === 'done') {
+                    console.log(`Answered by ${data.backend}, first token after ${data.ttft_ms} ms`);
+                } else if (event === 'error') {
+                    console.warn('Chat stream error:', data.message);
+                }
+            }
+        };
+
+        if (response.body) {
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                feed(decoder.decode(value, { stream: true }));
+            }
+        } else {
+            // No streaming support: the same events arrive all at once
+            feed(await response.text());
+        }
+
+        this.hideTyping();
+        if (!messageDiv) {
+            this.addMessage("No response from assistant.", 'assistant');
+            return;
+        }
+        this.rememberMessage(text, 'assistant');
+    }
+
+    parseEvent(block) {
+        let event = 'message';
+        const dataLines = [];
+        for (const line of block.split('\n')) {
+            if (line.startsWith('event:')) event = line.slice(6).trim();
+            else if (line.startsWith('data:')) dataLines.push(line.slice(5).trim());
+        }
+        let data = {};
+        try {
+            data = JSON.parse(dataLines.join('\n') || '{}');
+        } catch (e) {
+            console.warn('Bad event data', e);
+        }
+        return { event, data };
+    }
+
+    createMessageElement(role) {
         const messagesContainer = document.getElementById('chatbot-messages');
         const messageDiv = document.createElement('div');
 
         messageDiv.className = `message ${role}`;
-        messageDiv.textContent = content;
         messagesContainer.appendChild(messageDiv);
+        return messageDiv;
+    }
 
+    rememberMessage(content, role) {
         this.conversationHistory.push({ role, content });
 
         if (this.conversationHistory.length > 10) {
             this.conversationHistory = this.conversationHistory.slice(-10);
         }
+    }
 
+    addMessage(content, role) {
+        const messageDiv = this.createMessageElement(role);
+        messageDiv.textContent = content;
+        this.rememberMessage(content, role);
         this.scrollToBottom();
     }
 
@@ -0,0 +1,110 @@
+"""
+Benchmark full-resolution vs reduced-resolution (PIL draft) JPEG decoding.
+
+For every sample image this times the current path (full decode + resize to the
+model input, as transforms.Resize does) against open_image(..., draft_size),
+and reports how far the resized pixels drift (mean absolute error / PSNR).
+With --checkpoint it also runs FoodPredictor both ways and reports top-1
+agreement, accuracy against the class folder names and per-image latency.
+
+Usage:
+    python ml/benchmark_decode.py --images ml/dataset --limit 100 [--checkpoint ml/models/food_classifier.pth]
+"""
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from ml.image_decode import open_image
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png'}
+
+
+def find_images(root: Path, limit: int):
+    images = sorted(p for p in root.rglob('*') if p.suffix.lower() in IMAGE_EXTENSIONS)
+    return images[:limit] if limit else images
+
+
+def load_resized(path, size, draft):
+    start = time.perf_counter()
+    img = open_image(path, (size, size) if draft else None)
+    img = img.resize((size, size), Image.BILINEAR)
+    return np.asarray(img, dtype=np.float32), (time.perf_counter() - start) * 1000
+
+
+def psnr(mse):
+    return float('inf') if mse == 0 else 10 * np.log10(255.0 ** 2 / mse)
+
+
+def benchmark_decode(images, size):
+    full_ms, draft_ms, maes, psnrs = [], [], [], []
+    for path in images:
+        full, t_full = load_resized(path, size, draft=False)
+        fast, t_fast = load_resized(path, size, draft=True)
+        full_ms.append(t_full)
+        draft_ms.append(t_fast)
+        maes.append(float(np.abs(full - fast).mean()))
+        psnrs.append(psnr(float(((full - fast) ** 2).mean())))
+
+    print(f"\nDecode + resize to {size}x{size} on {len(images)} images")
+    print(f"  full decode : median {statistics.median(full_ms):7.2f} ms | mean {statistics.mean(full_ms):7.2f} ms")
+    print(f"  draft decode: median {statistics.median(draft_ms):7.2f} ms | mean {statistics.mean(draft_ms):7.2f} ms")
+    print(f"  speedup     : {statistics.mean(full_ms) / max(statistics.mean(draft_ms), 1e-9):.2f}x")
+    finite = [p for p in psnrs if p != float('inf')]
+    print(f"  pixel drift : MAE {statistics.mean(maes):.2f} / 255 | PSNR {statistics.median(finite) if finite else float('inf'):.1f} dB (median)")
+
+
+def benchmark_model(images, checkpoint):
+    from ml.food_predictor import FoodPredictor
+
+    full = FoodPredictor(checkpoint, confidence_threshold=0.0)
+    fast = FoodPredictor(checkpoint, confidence_threshold=0.0, fast_decode=True)
+    normalize = lambda name: name.lower().replace('_', ' ')
+
+    agree = correct_full = correct_fast = 0
+    full_ms, fast_ms = [], []
+    for path in images:
+        start = time.perf_counter()
+        a = full.predict(str(path))
+        full_ms.append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        b = fast.predict(str(path))
+        fast_ms.append((time.perf_counter() - start) * 1000)
+
+        label = normalize(path.parent.name)
+        agree += a['class'] == b['class']
+        correct_full += normalize(a['class']) == label
+        correct_fast += normalize(b['class']) == label
+
+    n = len(images)
+    print(f"\nFoodPredictor on {n} images")
+    print(f"  full decode : {statistics.mean(full_ms):7.2f} ms/image | accuracy {correct_full / n:.3f}")
+    print(f"  draft decode: {statistics.mean(fast_ms):7.2f} ms/image | accuracy {correct_fast / n:.3f}")
+    print(f"  top-1 agreement: {agree / n:.3f}")
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument('--images', default=str(Path(__file__).resolve().parent / 'dataset'))
+    p.add_argument('--limit', type=int, default=100)
+    p.add_argument('--size', type=int, default=384)
+    p.add_argument('--checkpoint', default=None)
+    args = p.parse_args()
+
+    images = find_images(Path(args.images), args.limit)
+    if not images:
+        print(f"No images found under {args.images}. Run ml/prepare_dataset.py first or pass --images.")
+        return
+
+    benchmark_decode(images, args.size)
+    if args.checkpoint:
+        benchmark_model(images, args.checkpoint)
+
+
+if __name__ == '__main__':
+    main()
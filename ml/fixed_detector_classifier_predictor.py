@@ -4,7 +4,6 @@ Fixed Detector + Classifier Predictor
 - Implements confidence threshold for unknown food detection
 - Exposes predict(file-like) -> dict with proper confidence handling
 """
-from pathlib import Path
 import torch
 from PIL import Image
 import timm
@@ -12,11 +11,12 @@ import torchvision.transforms as T
 import numpy as np
 
 class FixedDetectorClassifierPredictor:
-    def __init__(self, yolo_weights: str, clf_ckpt: str, img_size: int = 384, confidence_threshold: float = 0.6):
+    def __init__(self, yolo_weights: str, clf_ckpt: str, img_size: int = 384, confidence_threshold: float = 0.6, min_det_conf: float = 0.0):
         self.yolo_weights = yolo_weights
         self.clf_ckpt = clf_ckpt
         self.img_size = img_size
         self.confidence_threshold = confidence_threshold
+        self.min_det_conf = min_det_conf  # boxes below this YOLO confidence are not classified
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 
         # Load YOLO model
@@ -47,38 +47,43 @@ class FixedDetectorClassifierPredictor:
             T.Normalize(mean=(0.485,0.456,0.406), std=(0.229,0.224,0.225))
         ])
 
+    def classify_batch(self, images):
+        # Classify a list of PIL images in a single forward pass -> [(label, confidence), ...]
+        t = torch.stack([self.transform(im) for im in images]).to(self.device)
+        with torch.no_grad():
+            logits = self.clf(t)
+            probs = torch.softmax(logits, dim=1)
+            p, idx = probs.max(1)
+        return [(self.classes[i], float(conf)) for conf, i in zip(p.tolist(), idx.tolist())]
+
     def predict(self, image_file):
         # image_file: path or file-like
-        if isinstance(image_file, (str, Path)):
-            img = Image.open(image_file).convert('RGB')
-        else:
-            img = Image.open(image_file).convert('RGB')
+        img = Image.open(image_file).convert('RGB')
 
         results = self.yolo([np.array(img)])
         xyxy = results.xyxy[0].cpu().numpy()
 
-        predictions = []
+        # Crop every confident, non-empty box, then classify all crops together
+        crops, det_confs = [], []
         for box in xyxy:
             x1,y1,x2,y2,conf,cls = box
+            if conf < self.min_det_conf:
+                continue
             x1,y1,x2,y2 = map(int, [x1,y1,x2,y2])
-            crop = img.crop((x1,y1,x2,y2))
-            t = self.transform(crop).unsqueeze(0).to(self.device)
-            with torch.no_grad():
-                logits = self.clf(t)
-                probs = torch.softmax(logits, dim=1)
-                p, idx = probs.max(1)
-                label = self.classes[idx.item()]
-            predictions.append({'label': label, 'det_conf': float(conf), 'clf_conf': float(p.item())})
+            if x2 <= x1 or y2 <= y1:
+                continue
+            crops.append(img.crop((x1,y1,x2,y2)))
+            det_confs.append(float(conf))
+
+        predictions = []
+        if crops:
+            for (label, clf_conf), det_conf in zip(self.classify_batch(crops), det_confs):
+                predictions.append({'label': label, 'det_conf': det_conf, 'clf_conf': clf_conf})
 
         if len(predictions) == 0:
             # fallback classify on full image
-            t = self.transform(img).unsqueeze(0).to(self.device)
-            with torch.no_grad():
-                logits = self.clf(t)
-                probs = torch.softmax(logits, dim=1)
-                p, idx = probs.max(1)
-                label = self.classes[idx.item()]
-            predictions.append({'label': label, 'det_conf': 0.0, 'clf_conf': float(p.item())})
+            label, clf_conf = self.classify_batch([img])[0]
+            predictions.append({'label': label, 'det_conf': 0.0, 'clf_conf': clf_conf})
 
         # Get highest confidence prediction
         best_prediction = max(predictions, key=lambda x: x['clf_conf'])
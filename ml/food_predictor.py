@@ -7,11 +7,36 @@ from PIL import Image
 import torchvision.transforms as transforms
 import cv2
 import numpy as np
+import json
+import time
+from functools import lru_cache
+from pathlib import Path
+
+from ml.image_decode import InvalidImageError, open_image
+
+class DecodedImage:
+    """An upload decoded once; its pixel array is shared by the classifier and the size estimator"""
+    def __init__(self, image_path_or_file, draft_size=None):
+        self.image = open_image(image_path_or_file, draft_size)
+        self._array = None
+    
+    @property
+    def array(self):
+        """HxWx3 uint8 RGB array, copied out of PIL once and then only viewed"""
+        if self._array is None:
+            self._array = np.array(self.image)
+        return self._array
+    
+    def tensor(self):
+        """3xHxW uint8 tensor viewing the same memory as array (no copy)"""
+        return torch.from_numpy(self.array).permute(2, 0, 1)
 
 class FoodPredictor:
-    def __init__(self, model_path, confidence_threshold=0.1):
+    def __init__(self, model_path, confidence_threshold=0.1, fast_decode=False):
         self.model_path = model_path
         self.confidence_threshold = confidence_threshold
+        # Reduced-resolution JPEG decode close to the model input size
+        self.draft_size = (384, 384) if fast_decode else None
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
         
         # Load model
@@ -22,24 +47,24 @@ class FoodPredictor:
         self.model = self.model.to(self.device)
         self.model.eval()
         
-        # Transform
+        # Transform, applied to the uint8 tensor view of the decoded pixels
         self.transform = transforms.Compose([
-            transforms.Resize((384, 384)),
-            transforms.ToTensor(),
+            transforms.Resize((384, 384), antialias=True),
+            transforms.ConvertImageDtype(torch.float32),
             transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
         ])
     
     def estimate_size(self, image_path):
         """Estimate food size based on image analysis"""
         if isinstance(image_path, str):
-            img = cv2.imread(image_path)
+            gray = cv2.cvtColor(cv2.imread(image_path), cv2.COLOR_BGR2GRAY)
         else:
-            # Convert PIL to cv2
-            img_array = np.array(Image.open(image_path))
-            img = cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
+            # Reuse already-decoded pixels instead of decoding the upload again
+            if not isinstance(image_path, DecodedImage):
+                image_path = DecodedImage(image_path)
+            gray = cv2.cvtColor(image_path.array, cv2.COLOR_RGB2GRAY)
         
-        # Convert to grayscale and find contours
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        # Find contours on the grayscale image
         blurred = cv2.GaussianBlur(gray, (5, 5), 0)
         _, thresh = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
         
@@ -51,7 +76,7 @@ class FoodPredictor:
             area = cv2.contourArea(largest_contour)
             
             # Estimate size based on area (rough approximation)
-            img_area = img.shape[0] * img.shape[1]
+            img_area = gray.shape[0] * gray.shape[1]
             food_ratio = area / img_area
             
             if food_ratio > 0.3:
@@ -65,78 +90,107 @@ class FoodPredictor:
     
     def predict(self, image_path_or_file):
         """Predict food type and size"""
-        # Load and preprocess image
-        if isinstance(image_path_or_file, str):
-            image = Image.open(image_path_or_file).convert('RGB')
-        else:
-            image = Image.open(image_path_or_file).convert('RGB')
+        result = self.predict_batch([image_path_or_file])[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+    
+    def predict_batch(self, images):
+        """
+        Predict food type and size for several images in one forward pass.
+        An image that cannot be decoded gets its InvalidImageError in its slot
+        instead of a result; the rest of the batch is still classified.
+        """
+        if not images:
+            return []
+        
+        # Decode each upload once; the same pixels feed the classifier and size estimator
+        start = time.perf_counter()
+        slots = []
+        for image in images:
+            try:
+                slots.append(DecodedImage(image, self.draft_size))
+            except InvalidImageError as e:
+                slots.append(e)
+        decoded = [slot for slot in slots if isinstance(slot, DecodedImage)]
+        decode_ms = (time.perf_counter() - start) * 1000
+        if not decoded:
+            return slots
         
-        input_tensor = self.transform(image).unsqueeze(0).to(self.device)
+        start = time.perf_counter()
+        input_tensor = torch.stack([self.transform(image.tensor()) for image in decoded]).to(self.device)
+        preprocess_ms = (time.perf_counter() - start) * 1000
         
         # Predict
+        start = time.perf_counter()
         with torch.no_grad():
             outputs = self.model(input_tensor)
             probabilities = torch.softmax(outputs, dim=1)
-            confidence, predicted_idx = torch.max(probabilities, 1)
-            
-            confidence = confidence.item()
-            predicted_class = self.classes[predicted_idx.item()]
+            confidences, predicted_idx = torch.max(probabilities, 1)
+        inference_ms = (time.perf_counter() - start) * 1000
         
+        results = {}
+        for image, confidence, idx in zip(decoded, confidences.tolist(), predicted_idx.tolist()):
+            result = self._build_result(image, confidence, self.classes[idx])
+            # Batch-wide stages are reported per image
+            result['timings_ms'].update({
+                'decode': round(decode_ms / len(decoded), 2),
+                'preprocess': round(preprocess_ms / len(decoded), 2),
+                'inference': round(inference_ms / len(decoded), 2)
+            })
+            results[id(image)] = result
+        return [results[id(slot)] if isinstance(slot, DecodedImage) else slot for slot in slots]
+    
+    def _build_result(self, image, confidence, predicted_class):
         # Check confidence threshold
         if confidence < self.confidence_threshold:
             return {
                 'class': 'Unknown food',
                 'confidence': confidence,
                 'size': 'unknown',
-                'is_unknown': True
+                'is_unknown': True,
+                'timings_ms': {'size': 0.0}
             }
         
         # Estimate size
-        size = self.estimate_size(image_path_or_file)
+        start = time.perf_counter()
+        size = self.estimate_size(image)
+        size_ms = (time.perf_counter() - start) * 1000
         
         return {
             'class': predicted_class,
             'confidence': confidence,
             'size': size,
-            'is_unknown': False
+            'is_unknown': False,
+            'timings_ms': {'size': round(size_ms, 2)}
         }
 
+NUTRITION_DATA_PATH = Path(__file__).resolve().parent.parent / 'backend' / 'nutrition_data.json'
+
+@lru_cache(maxsize=1)
+def _load_nutrition_table():
+    """The shared local nutrition table, read once"""
+    with open(NUTRITION_DATA_PATH, 'r') as f:
+        return json.load(f)
+
 def get_nutrition_data(food_name, size):
     """Get nutrition data based on food type and size"""
+    entry = _load_nutrition_table().get(food_name, {})
+    display_name = entry.get('display_name', food_name)
     
-    # Map internal names to display names
-    display_names = {
-        'chapati': 'Chapati',
-        'paneer_butter_masala': 'Paneer Butter Masala'
-    }
-    
-    # Base nutrition data per serving
-    nutrition_db = {
-        'chapati': {
-            'small': {'calories': 80, 'protein_g': 3, 'carbs_g': 15, 'fat_g': 1, 'serving_size': '1 small chapati (6 inch)'},
-            'medium': {'calories': 120, 'protein_g': 4, 'carbs_g': 22, 'fat_g': 2, 'serving_size': '1 medium chapati (7 inch)'},
-            'large': {'calories': 160, 'protein_g': 5, 'carbs_g': 30, 'fat_g': 3, 'serving_size': '1 large chapati (8 inch)'}
-        },
-        'paneer_butter_masala': {
-            'small': {'calories': 250, 'protein_g': 12, 'carbs_g': 8, 'fat_g': 18, 'serving_size': '1 small bowl (100g)'},
-            'medium': {'calories': 350, 'protein_g': 16, 'carbs_g': 12, 'fat_g': 25, 'serving_size': '1 medium bowl (150g)'},
-            'large': {'calories': 450, 'protein_g': 20, 'carbs_g': 16, 'fat_g': 32, 'serving_size': '1 large bowl (200g)'}
-        }
-    }
-    
-    if food_name in nutrition_db and size in nutrition_db[food_name]:
-        data = nutrition_db[food_name][size].copy()
-        data['food'] = display_names.get(food_name, food_name)  # Use display name
+    if size in entry.get('sizes', {}):
+        data = dict(entry['sizes'][size])
+        data['food'] = display_name  # Use display name
         data['source'] = 'Database'
         return data
     
     # Default fallback
     return {
-        'food': display_names.get(food_name, food_name),
+        'food': display_name,
         'calories': 200,
         'protein_g': 8.0,
         'carbs_g': 20.0,
         'fat_g': 10.0,
         'serving_size': '1 serving',
         'source': 'Estimated'
-    }
\ No newline at end of file
+    }
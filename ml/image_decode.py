@@ -0,0 +1,32 @@
+"""
+Image decoding helpers shared by the predictors.
+
+open_image(..., draft_size=(w, h)) asks libjpeg to decode directly at a reduced
+DCT scale (1/2, 1/4 or 1/8) that is still at least draft_size in both
+dimensions, so a 12MP phone photo headed for a 384px model skips most of the
+full-resolution decode. Formats without DCT scaling (PNG, WebP, ...) ignore the
+hint and are decoded at full resolution.
+
+Unreadable, truncated or oversized uploads raise InvalidImageError, so batch
+predictors can fail that one image and still classify the rest.
+"""
+from PIL import Image
+
+
+class InvalidImageError(ValueError):
+    """Raised when an upload cannot be decoded as an image."""
+
+
+def open_image(image_path_or_file, draft_size=None):
+    """Open an image as RGB, decoding JPEGs near draft_size when given"""
+    try:
+        image = Image.open(image_path_or_file)
+        if draft_size and image.format == 'JPEG':
+            # Must happen before the pixels are loaded
+            image.draft('RGB', tuple(draft_size))
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        image.load()
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        raise InvalidImageError(f"Could not decode image: {e}") from e
+    return image
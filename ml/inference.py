@@ -7,13 +7,14 @@ import random
 try:
     import tensorflow as tf
     from PIL import Image
+    from ml.image_decode import open_image
     TF_AVAILABLE = True
 except ImportError:
     TF_AVAILABLE = False
     print("Warning: TensorFlow/Pillow not installed. Running in Mock Mode only.")
 
 class FoodPredictor:
-    def __init__(self, model_path=None, class_names_path=None):
+    def __init__(self, model_path=None, class_names_path=None, fast_decode=False):
         """
         Initialize predictor. 
         If model_path is None or file doesn't exist, initializes in MOCK mode.
@@ -22,6 +23,7 @@ class FoodPredictor:
         self.class_names = None
         self.img_size = (224, 224)
         self.mock_mode = False
+        self.fast_decode = fast_decode  # decode JPEGs near img_size instead of full resolution
 
         if model_path and os.path.exists(model_path) and TF_AVAILABLE:
             print(f"Loading model from {model_path}...")
@@ -56,7 +58,7 @@ class FoodPredictor:
             img = tf.keras.preprocessing.image.load_img(image_path_or_file, target_size=self.img_size)
         else:
             # Assume it's a file-like object (BytesIO) from API upload
-            img = Image.open(image_path_or_file).convert('RGB')
+            img = open_image(image_path_or_file, self.img_size if self.fast_decode else None)
             img = img.resize(self.img_size)
             
         img_array = tf.keras.preprocessing.image.img_to_array(img)
@@ -74,25 +76,51 @@ class FoodPredictor:
         try:
             img_array = self.preprocess_image(image_path_or_file)
             predictions = self.model.predict(img_array)
-            probs = predictions[0]
-            # Top-k
-            top_k = min(5, len(probs))
-            top_idx = np.argsort(probs)[::-1][:top_k]
-            results = []
-            for idx in top_idx:
-                name = self.class_names[idx] if self.class_names else str(idx)
-                results.append({"class": name, "score": float(probs[idx])})
-
-            best = results[0]
-            return {
-                "class": best['class'],
-                "confidence": best['score'],
-                "top_k": results
-            }
+            return self._format_prediction(predictions[0])
         except Exception as e:
             print(f"Prediction failed: {e}. Returning mock result.")
             return self._mock_predict()
 
+    def predict_batch(self, images):
+        """
+        Returns one prediction per image, using a single model.predict call.
+        An image that cannot be preprocessed gets its exception in its slot
+        instead of a result; a model failure raises for the whole batch.
+        """
+        if self.mock_mode:
+            return [self._mock_predict() for _ in images]
+        if not images:
+            return []
+
+        slots = []
+        for image in images:
+            try:
+                slots.append(self.preprocess_image(image))
+            except Exception as e:
+                slots.append(e)
+        arrays = [slot for slot in slots if not isinstance(slot, Exception)]
+        if not arrays:
+            return slots
+
+        predictions = iter(self.model.predict(tf.concat(arrays, axis=0)))
+        return [slot if isinstance(slot, Exception) else self._format_prediction(next(predictions)) for slot in slots]
+
+    def _format_prediction(self, probs):
+        # Top-k
+        top_k = min(5, len(probs))
+        top_idx = np.argsort(probs)[::-1][:top_k]
+        results = []
+        for idx in top_idx:
+            name = self.class_names[idx] if self.class_names else str(idx)
+            results.append({"class": name, "score": float(probs[idx])})
+
+        best = results[0]
+        return {
+            "class": best['class'],
+            "confidence": best['score'],
+            "top_k": results
+        }
+
     def _mock_predict(self):
         """
         Mock prediction for testing without a trained model.
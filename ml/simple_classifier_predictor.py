@@ -9,10 +9,14 @@ from PIL import Image
 import timm
 import torchvision.transforms as T
 
+from ml.image_decode import InvalidImageError, open_image
+
 class SimpleClassifierPredictor:
-    def __init__(self, clf_ckpt: str, img_size: int = 384):
+    def __init__(self, clf_ckpt: str, img_size: int = 384, fast_decode: bool = False):
         self.clf_ckpt = clf_ckpt
         self.img_size = img_size
+        # Reduced-resolution JPEG decode, still large enough for Resize + CenterCrop
+        self.draft_size = (int(self.img_size*1.1),) * 2 if fast_decode else None
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 
         # Load classifier
@@ -32,21 +36,40 @@ class SimpleClassifierPredictor:
 
     def predict(self, image_file):
         # image_file: path or file-like
-        if isinstance(image_file, (str, Path)):
-            img = Image.open(image_file).convert('RGB')
-        else:
-            img = Image.open(image_file).convert('RGB')
+        result = self.predict_batch([image_file])[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def predict_batch(self, image_files):
+        # image_files: list of paths or file-likes, classified in one forward pass.
+        # An undecodable image gets its InvalidImageError in its slot; the others are still classified.
+        if not image_files:
+            return []
+        slots = []
+        for f in image_files:
+            try:
+                slots.append(open_image(f, self.draft_size))
+            except InvalidImageError as e:
+                slots.append(e)
+        imgs = [img for img in slots if not isinstance(img, Exception)]
+        if not imgs:
+            return slots
 
-        # Classify entire image
-        t = self.transform(img).unsqueeze(0).to(self.device)
+        # Classify entire images
+        t = torch.stack([self.transform(img) for img in imgs]).to(self.device)
         with torch.no_grad():
             logits = self.clf(t)
             probs = torch.softmax(logits, dim=1)
             p, idx = probs.max(1)
-            label = self.classes[idx.item()] if self.classes else str(idx.item())
 
-        return {
-            'items': [label], 
-            'confidence': float(p.item()),
-            'class': label
-        }
\ No newline at end of file
+        results = []
+        for conf, i in zip(p.tolist(), idx.tolist()):
+            label = self.classes[i] if self.classes else str(i)
+            results.append({
+                'items': [label],
+                'confidence': float(conf),
+                'class': label
+            })
+        results = iter(results)
+        return [slot if isinstance(slot, Exception) else next(results) for slot in slots]
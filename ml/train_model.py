@@ -214,16 +214,20 @@ def train(args):
         sys.path.insert(0, str(WORKSPACE_ROOT / 'backend'))
         from nutrition_apis import NutritionService
         svc = NutritionService()
-        nutrition_info = {}
-        for cls in classes:
-            # Convert folder name to readable food name
-            food_name = cls.replace('_', ' ')
-            print(f"Fetching nutrition for {food_name}...")
-            info = svc.get_nutrition_info(food_name)
-            nutrition_info[cls] = info
+        # Convert folder names to readable food names
+        food_names = {cls: cls.replace('_', ' ') for cls in classes}
+        # Partial results survive an interrupted run and are reused on the next one
+        partial_path = MODELS_DIR / 'nutrition_info.partial.json'
+        found = svc.get_nutrition_info_many(
+            list(food_names.values()),
+            max_concurrency=args.nutrition_concurrency,
+            output_path=str(partial_path)
+        )
+        nutrition_info = {cls: found[name] for cls, name in food_names.items()}
 
         with open(MODELS_DIR / 'nutrition_info.json', 'w') as f:
             json.dump(nutrition_info, f, indent=2)
+        partial_path.unlink(missing_ok=True)
         print("Saved nutrition_info.json")
     except Exception as e:
         print(f"Nutrition lookup failed or not configured: {e}")
@@ -237,6 +241,7 @@ def parse_args():
     p.add_argument('--batch-size', type=int, default=32)
     p.add_argument('--save-every-batches', type=int, default=200, dest='save_every_batches')
     p.add_argument('--resume', action='store_true')
+    p.add_argument('--nutrition-concurrency', type=int, default=8, dest='nutrition_concurrency')
     return p.parse_args()
 
 